@@ -3,105 +3,276 @@
 Created on Wed Feb 14 16:25:32 2018
 
 @author: Oisin Creaner
-This program is designed to read in an ACC file from LOFAR and convert it to 
-a csv file with the same name but different extension
+This program is designed to read in an ACC file from LOFAR and convert it to
+a csv file with the same name but different extension.  The data can instead
+be written to a HDF5 or NPY file which keeps the shape of the ACC cube.
+
+The ACC file is memory-mapped as an array of complex numbers with one
+covariance matrix per subband, so only the subband being written is read from
+disk.  Each subband is formatted and written in one operation.  Covariances
+are written as (re+imj), as integers if every covariance in the subband is a
+whole number and otherwise with 17 significant digits, so that the csv file
+reads back to the same values.
+
+usage: python ACC_CSV_Converter.py [-h] [--out_dir OUT_DIR] [--rcus RCUS]
+                                   [--subbands SUBBANDS] [--jobs JOBS]
+                                   [--format {csv,hdf5,npy}]
+                                   acc_file [acc_file ...]
 """
-import struct
-import numpy as np
+import argparse
+import multiprocessing
 import os
 import sys
 
-#definitions of file names
-#hard coded for demo purposes, can edit - this probably should be a parameter
-test_file='C:\\Users\\User\\Dropbox\\Work\\DIAS\\RINGS\\BeamModelling\\ACC_Files\\20120513_052251_acc_512x192x192.dat'
-out_file=test_file.replace(".dat",".csv")
-
-#defines parameters to do with the RCU count - this could be a parameter
-rcu_count=192 #defined for LBA stations
-count=(rcu_count**2)*2  #size of covariance matrix: NxN complex (float x 2) elements
-count_string="<%dd"%count #"<73728d" format string for unpack: Little endian 73728 floats
-
-#sets the number of subbands - could be parameterised
-subbands=1#512 
-float_size=8 #Is this fully portable?  Is there an automatic way of handling this?
-
-#sets up a variable for subband index
-subband_index=0
-
-#sets up variables to be used to do some stats on the correlation matrices.  Not currently used
-#mean_list=[]
-#sd_list=[]
-
-#checks that the filename has been successfully changed for the output
-if test_file==out_file:
-    sys.exit("Incorrect File Type")
-
-#tests to see if the file is right
-in_size= os.path.getsize(test_file)
-expected_size=count*subbands*float_size
-if in_size < expected_size:
-    print("file too small")
-    sys.exit()
-    
-    
-#opens the input file
-try:
-    test_fv=open(test_file, "rb")
-except IOError:
-    print("File not found")
-    sys.exit("Unable to open "+test_file)
-
-#opens the output file
-try:
-    out_fv=open(out_file, "w")
-except IOError:
-    print("File not found")
-    sys.exit("Unable to open "+out_file)
-
-#writes the header to it
-out_fv.write("Subband,RCU(i),RCU(j),Covariance\n")
-
-
-
-
-#goes through the subbands one at a time per loop
-while subband_index < subbands: 
-    #reads a covariance matrix from the input file, unpacks it according to the format string
-    #and converts it to an array in numpy
-    test_value = np.array(struct.unpack(count_string,test_fv.read(float_size*count)))
-    
-    #converts the array to an array of complex numbers.  
-    test_value.dtype = complex
-    
-    #increments the suband index - could probably do this better in a for loop
-    subband_index = subband_index + 1
-    #resets the output string every subband
-    test_out=""
-    
-    #some code to do stats on the file.  Probably not correct use - to delete in future versions
-#    mean_list.append(np.mean(test_value))
-#    sd_list.append(np.std(test_value))
-    
-    #goes through each row of the covariance matrix
-    for i in range(rcu_count):
-        #goes through the columns of the covariance matrix
-        for j in range (rcu_count):
-            #1-d implementation - needs to calculate index.  Would prefer to make a 2-d array from the start
-            element_number = i*rcu_count+j
-            #converts the element to a row suitable for molten data
-            out_string = str(subband_index)+","+str(i)+","+str(j)+","+str(test_value[element_number])+"\n"
-            #adds it to an output string
-            test_out=test_out+out_string
-    #writes one subband at a time - preserves memory            
-    out_fv.write(test_out)    
-    
-
-#closes the files
-test_fv.close()
-out_fv.close()
-
-#print mean_list
-#print sd_list
+import numpy as np
+
+# the ACC file format is shared with the comparison module, which reads ACC
+# files and the cubes written by this program
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "comparison_module"))
+
+from acc_functions import ACC_DTYPE
+from acc_functions import ACC_RCU_COUNT
+from acc_functions import map_acc_file
+
+
+def acc_arg_parser():
+    '''
+    Reads the command line arguments for the converter and returns them
+    '''
+    parser = argparse.ArgumentParser(description='''
+Converts LOFAR ACC files to csv files with a row for the covariance of each
+pair of RCUs in each subband.
+                                     ''')
+
+    parser.add_argument("acc_files", nargs="+",
+                        help='''
+The ACC files to convert.  Each is written to a file with the same name and
+the extension of the output format
+                        ''')
+
+    parser.add_argument("--out_dir", "-o", default=None,
+                        help='''
+Directory to write the output files to.  Default is the directory of each
+input file
+                        ''')
+
+    parser.add_argument("--rcus", "-r", default=ACC_RCU_COUNT, type=int,
+                        help='''
+Number of RCUs in the covariance matrices.  Default is 192, for LBA stations
+                        ''')
+
+    parser.add_argument("--subbands", "-s", default=None, type=int,
+                        help='''
+Number of subbands to convert.  Default is every subband in the file
+                        ''')
+
+    parser.add_argument("--jobs", "-j", default=1, type=int,
+                        help='''
+Number of processes used to format the subbands.  Default is 1
+                        ''')
+
+    parser.add_argument("--format", "-f", default="csv",
+                        choices=("csv", "hdf5", "npy"),
+                        help='''
+Format of the output files.  csv writes a row for each subband and pair of 
+RCUs.  hdf5 writes the cube to an "acc" dataset with one compressed chunk per
+subband.  npy writes the cube as a NumPy array.  hdf5 and npy keep the
+(subband, rcu, rcu) shape of the cube.  Default is csv
+                        ''')
+
+    return (parser.parse_args())
+
+
+def read_acc_file(acc_file, rcu_count=ACC_RCU_COUNT, subbands=None):
+    '''
+    Memory-maps an ACC file as a complex array of shape
+    (subbands, rcu_count, rcu_count) with map_acc_file.  If subbands is None,
+    the number of subbands is calculated from the size of the file.
+    '''
+    # tests to see if the file is right
+    try:
+        acc_cube = map_acc_file(acc_file, rcu_count, subbands)
+    except (IOError, OSError, ValueError) as error:
+        sys.exit(str(error))
+
+    if subbands is None and os.path.getsize(acc_file) != acc_cube.nbytes:
+        print("WARNING: "+acc_file+" is not a whole number of "+
+              str(rcu_count)+"x"+str(rcu_count)+" covariance matrices")
+
+    return (acc_cube)
+
+
+def get_out_file(acc_file, extension, out_dir=None):
+    '''
+    Returns the output file name for an ACC file, replacing the .dat
+    extension
+    '''
+    out_file = os.path.splitext(acc_file)[0]+extension
+    if out_dir is not None:
+        out_file = os.path.join(out_dir, os.path.basename(out_file))
+
+    # checks that the filename has been successfully changed for the output
+    if os.path.abspath(out_file) == os.path.abspath(acc_file):
+        sys.exit("Incorrect File Type")
+    return (out_file)
+
+
+def write_acc_csv(acc_cube, out_file, jobs=1):
+    '''
+    Writes an ACC cube to a csv file as molten data with one row for each
+    subband, RCU(i) and RCU(j).  Subbands are numbered from 1.
+
+    If jobs is more than 1, the subbands are formatted in a pool of processes
+    and written in order as they are finished.
+    '''
+    # opens the output file
+    try:
+        out_fv = open(out_file, "w")
+    except IOError:
+        sys.exit("Unable to open "+out_file)
+
+    with out_fv:
+        # writes the header to it
+        out_fv.write("Subband,RCU(i),RCU(j),Covariance\n")
+
+        subbands = range(acc_cube.shape[0])
+        if jobs <= 1:
+            init_csv_worker(acc_cube)
+            for subband in subbands:
+                out_fv.write(format_subband(subband))
+        else:
+            # memory-mapped cubes are mapped again by each process, rather
+            # than being copied to it
+            if isinstance(acc_cube, np.memmap):
+                initargs = (None, acc_cube.filename, acc_cube.shape)
+            else:
+                initargs = (acc_cube,)
+            pool = multiprocessing.Pool(jobs, initializer=init_csv_worker,
+                                        initargs=initargs)
+            try:
+                for subband_text in pool.imap(format_subband, subbands):
+                    out_fv.write(subband_text)
+            finally:
+                pool.close()
+                pool.join()
+
+
+def write_acc_hdf5(acc_cube, out_file, acc_file=""):
+    '''
+    Writes an ACC cube to an "acc" dataset in a HDF5 file, one subband at a
+    time.  The dataset is chunked by subband and compressed, so that single
+    subbands can be read without reading the whole cube.
+    '''
+    try:
+        import h5py
+    except ImportError:
+        sys.exit("Unable to import h5py to write "+out_file)
+
+    subbands, rcu_count = acc_cube.shape[0], acc_cube.shape[1]
+    try:
+        out_fv = h5py.File(out_file, "w")
+    except IOError:
+        sys.exit("Unable to open "+out_file)
+
+    with out_fv:
+        acc_set = out_fv.create_dataset("acc", shape=acc_cube.shape,
+                                        dtype=ACC_DTYPE,
+                                        chunks=(1, rcu_count, rcu_count),
+                                        compression="gzip", shuffle=True)
+        acc_set.attrs['rcu_count'] = rcu_count
+        acc_set.attrs['source_file'] = os.path.basename(acc_file)
+        for subband in range(subbands):
+            acc_set[subband] = acc_cube[subband]
+
+
+def write_acc_npy(acc_cube, out_file):
+    '''
+    Writes an ACC cube to a NPY file, one subband at a time, so that the whole
+    cube is never held in memory
+    '''
+    try:
+        out_cube = np.lib.format.open_memmap(out_file, mode="w+",
+                                             dtype=ACC_DTYPE,
+                                             shape=acc_cube.shape)
+    except IOError:
+        sys.exit("Unable to open "+out_file)
+
+    for subband in range(acc_cube.shape[0]):
+        out_cube[subband] = acc_cube[subband]
+    out_cube.flush()
+    del out_cube
+
+
+# the ACC cube and the row formats used by format_subband
+CSV_CUBE = None
+FLOAT_FORMAT = None
+INT_FORMAT = None
+
+# marks where the subband number goes in the row formats
+SUBBAND_MARK = "{subband}"
+
+# the largest whole number which a float holds exactly
+MAX_INT_FLOAT = 2.0**53
+
+
+def init_csv_worker(acc_cube, acc_file=None, shape=None):
+    '''
+    Sets the ACC cube to be formatted by format_subband, and builds the
+    format of the rows of a subband, which are the same for every subband
+    apart from the subband number, once.  If acc_file is given, the cube is
+    memory-mapped from that file with the given shape.
+    '''
+    global CSV_CUBE
+    global FLOAT_FORMAT
+    global INT_FORMAT
+    if acc_file is not None:
+        acc_cube = map_acc_file(acc_file, shape[1], shape[0])
+    CSV_CUBE = acc_cube
+    rcu_count = acc_cube.shape[1]
+    # one row per pair of RCUs, with the real and imaginary parts of the
+    # covariance filled in as (re+imj).  17 significant digits are enough to
+    # read every float back exactly
+    FLOAT_FORMAT = "".join([SUBBAND_MARK+","+str(i)+","+str(j)+
+                            ",(%.17g%+.17gj)\n" for i in range(rcu_count)
+                            for j in range(rcu_count)])
+    INT_FORMAT = FLOAT_FORMAT.replace("%.17g", "%d").replace("%+.17g", "%+d")
+
+
+def format_subband(subband):
+    '''
+    Returns the csv rows for one subband of the ACC cube.  Only this subband
+    is read from the input file.
+
+    The whole subband is formatted in one operation, from the real and
+    imaginary parts of the covariances in row order.  Subbands in which every
+    covariance is a whole number are formatted as integers, which is several
+    times faster than formatting floats.
+    '''
+    # the real and imaginary parts of the covariances, in the order stored
+    cov_parts = np.ascontiguousarray(CSV_CUBE[subband]).view('<f8').ravel()
+    row_format = FLOAT_FORMAT
+    # signed zeros and values too large to be exact integers keep the float
+    # format
+    if np.all(np.abs(cov_parts) < MAX_INT_FLOAT) and \
+            np.all(np.floor(cov_parts) == cov_parts) and \
+            not np.any(np.signbit(cov_parts[cov_parts == 0.0])):
+        row_format = INT_FORMAT
+        cov_parts = cov_parts.astype(np.int64)
+    row_format = row_format.replace(SUBBAND_MARK, str(subband+1))
+    return (row_format % tuple(cov_parts.tolist()))
 
 
+if __name__ == "__main__":
+    args = acc_arg_parser()
 
+    for acc_file in args.acc_files:
+        acc_cube = read_acc_file(acc_file, args.rcus, args.subbands)
+        out_file = get_out_file(acc_file, "."+args.format, args.out_dir)
+        print("Converting "+acc_file+" to "+out_file)
+        if args.format == "hdf5":
+            write_acc_hdf5(acc_cube, out_file, acc_file)
+        elif args.format == "npy":
+            write_acc_npy(acc_cube, out_file)
+        else:
+            write_acc_csv(acc_cube, out_file, args.jobs)
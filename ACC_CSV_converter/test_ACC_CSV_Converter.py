@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the ACC converter, checking the csv rows formatted for
+a whole subband at once against the original rows formatted one covariance at
+a time, and that cubes converted to each format read back unchanged with the
+ACC reader of the comparison module.
+
+usage: python -m pytest test_ACC_CSV_Converter.py
+
+@author: creanero
+"""
+import os
+
+import numpy as np
+import pytest
+
+import ACC_CSV_Converter as converter
+# the converter adds the comparison module to the path
+from reading_functions import read_acc_cube
+
+
+def make_acc_cube(subbands=3, rcu_count=6, whole=False):
+    '''
+    makes an ACC cube of random covariances, including values with exponents
+    and signed zeros, or of whole numbers if whole is set
+    '''
+    rng = np.random.RandomState(613)
+    shape = (subbands, rcu_count, rcu_count)
+    if whole:
+        return ((rng.randint(-10**6, 10**6, shape)+
+                 1j*rng.randint(-10**6, 10**6, shape)).astype(np.complex128))
+    acc_cube = (rng.randn(*shape)*10.0**rng.randint(-12, 12, shape)+
+                1j*rng.randn(*shape)*10.0**rng.randint(-12, 12, shape))
+    acc_cube[0, 0, 0] = complex(-0.0, -0.0)
+    acc_cube[0, 0, 1] = complex(0.0, -0.0)
+    return (acc_cube)
+
+
+def format_subband_loop(acc_cube, subband):
+    '''
+    the original formatting, which converts each covariance with str
+    '''
+    rcu_count = acc_cube.shape[1]
+    rows = ""
+    for i in range(rcu_count):
+        for j in range(rcu_count):
+            rows += (str(subband+1)+","+str(i)+","+str(j)+","+
+                     str(acc_cube[subband, i, j].item())+"\n")
+    return (rows)
+
+
+def parse_rows(rows):
+    '''
+    splits csv rows into their RCU fields and the covariances as complex
+    '''
+    fields = [row.split(",") for row in rows.splitlines()]
+    return ([row[:3] for row in fields],
+            np.array([complex(row[3]) for row in fields]))
+
+
+def test_format_subband_matches_loop():
+    '''
+    the bulk formatting gives the same rows and the same covariances, 
+    including signed zeros, as formatting each covariance in turn
+    '''
+    for whole in [False, True]:
+        acc_cube = make_acc_cube(whole=whole)
+        converter.init_csv_worker(acc_cube)
+        for subband in range(acc_cube.shape[0]):
+            bulk_fields, bulk_vals = parse_rows(
+                converter.format_subband(subband))
+            loop_fields, loop_vals = parse_rows(
+                format_subband_loop(acc_cube, subband))
+
+            assert bulk_fields == loop_fields
+            # compares the bits, so that signed zeros are also checked
+            assert (bulk_vals.view(np.int64) ==
+                    loop_vals.view(np.int64)).all()
+
+
+def read_acc_csv(file_name, shape):
+    '''
+    reads a csv file written by the converter back into an ACC cube
+    '''
+    acc_cube = np.zeros(shape, dtype=complex)
+    with open(file_name) as in_file:
+        assert in_file.readline() == "Subband,RCU(i),RCU(j),Covariance\n"
+        for row in in_file:
+            subband, rcu_i, rcu_j, cov = row.rstrip("\n").split(",")
+            acc_cube[int(subband)-1, int(rcu_i), int(rcu_j)] = complex(cov)
+    return (acc_cube)
+
+
+@pytest.mark.parametrize("out_format, jobs", [("csv", 1), ("csv", 2),
+                                              ("hdf5", 1), ("npy", 1)])
+def test_convert_round_trip(tmpdir, out_format, jobs):
+    '''
+    a raw ACC file memory-mapped and converted to each format reads back to
+    the same cube, as does the raw file itself
+    '''
+    acc_cube = make_acc_cube(subbands=3, rcu_count=6)
+    acc_file = os.path.join(str(tmpdir), "20180406_091321_acc_3x6x6.dat")
+    acc_cube.astype(converter.ACC_DTYPE).tofile(acc_file)
+    modes = {'verbose':0}
+
+    in_cube = converter.read_acc_file(acc_file, rcu_count=6)
+    assert isinstance(in_cube, np.memmap)
+    assert in_cube.shape == acc_cube.shape
+    dat_cube = read_acc_cube(acc_file, modes, rcu_count=6)
+    assert (dat_cube.view(np.int64) == acc_cube.view(np.int64)).all()
+
+    out_file = converter.get_out_file(acc_file, "."+out_format)
+    if out_format == "hdf5":
+        converter.write_acc_hdf5(in_cube, out_file, acc_file)
+    elif out_format == "npy":
+        converter.write_acc_npy(in_cube, out_file)
+    else:
+        converter.write_acc_csv(in_cube, out_file, jobs)
+
+    if out_format == "csv":
+        out_cube = read_acc_csv(out_file, acc_cube.shape)
+    else:
+        out_cube = np.asarray(read_acc_cube(out_file, modes)[()])
+    assert out_cube.shape == acc_cube.shape
+    # compares the bits, so that signed zeros are also checked
+    assert (out_cube.view(np.int64) == acc_cube.view(np.int64)).all()
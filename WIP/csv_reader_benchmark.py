@@ -0,0 +1,70 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Compares the bulk DreamBeam CSV reader with the complex converter reader on a
+synthetic DreamBeam file.
+
+usage: python csv_reader_benchmark.py [n_rows]
+
+@author: creanero
+"""
+import os
+import sys
+import tempfile
+import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "comparison_module"))
+
+from reading_functions import read_jones_csv
+from reading_functions import read_jones_csv_converters
+from reading_functions import JONES_COLS
+
+
+def make_dreambeam_csv(file_name, n_rows, n_freqs=512):
+    '''
+    writes a DreamBeam-style csv file with n_rows of random Jones matrices
+    '''
+    n_times = n_rows//n_freqs+1
+    times = pd.date_range("2018-03-01", periods=n_times, freq="519s")
+    freqs = 1e8+np.arange(n_freqs)*1e8/512
+    out_df = pd.DataFrame(data={
+        "Time": np.repeat(times.strftime("%Y-%m-%dT%H:%M:%S"), n_freqs)[:n_rows],
+        "Freq": np.tile(freqs, n_times)[:n_rows]})
+    for col in JONES_COLS:
+        vals = np.random.randn(n_rows)+1j*np.random.randn(n_rows)*1e-3
+        out_df[col] = [str(val) for val in vals]
+    out_df.to_csv(file_name, index=False,
+                  columns=["Time", "Freq"]+JONES_COLS)
+
+
+def timer(function_to_run, in_file):
+    start = datetime.datetime.now()
+    output = function_to_run(in_file)
+    diff = datetime.datetime.now()-start
+    return (output, diff.total_seconds())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        n_rows = int(sys.argv[1])
+    else:
+        n_rows = 1000000
+
+    file_name = os.path.join(tempfile.mkdtemp(), "dreambeam_benchmark.csv")
+    print("Writing "+str(n_rows)+" rows to "+file_name)
+    make_dreambeam_csv(file_name, n_rows)
+
+    conv_df, conv_time = timer(read_jones_csv_converters, file_name)
+    print("complex converters: "+str(conv_time)+"s")
+    bulk_df, bulk_time = timer(read_jones_csv, file_name)
+    print("bulk parsing:       "+str(bulk_time)+"s")
+
+    for col in JONES_COLS:
+        print(col+" maximum difference: "+
+              str(np.max(np.abs(conv_df[col].values-bulk_df[col].values))))
+
+    os.remove(file_name)
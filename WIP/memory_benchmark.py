@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measures the peak memory used by the read, merge and figure of merit stages of
+the comparison module on a synthetic observation, using tracemalloc.
+
+The polarisation and Stokes stages are run both on a copy of the dataframe and
+in place, to show the memory saved by not copying the observation.
+
+Needs Python 3, as tracemalloc is not available in Python 2.
+
+usage: python3 memory_benchmark.py [n_times] [n_freqs]
+
+@author: creanero
+"""
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "comparison_module"))
+
+from reading_functions import calc_xy
+from reading_functions import calc_stokes
+from reading_functions import merge_dfs
+from reading_functions import JONES_COLS
+from graphing_functions import calc_fom_table
+
+
+def make_model_df(n_times, n_freqs):
+    '''
+    creates a dataframe of random Jones matrices, as read from DreamBeam
+    '''
+    times = pd.date_range("2018-03-01", periods=n_times, freq="519s")
+    freqs = 1e8+np.arange(n_freqs)*1e8/512
+    out_df = pd.DataFrame(data={"Time":np.repeat(times, n_freqs),
+                                "Freq":np.tile(freqs, n_times)})
+    n_rows = len(out_df)
+    for col in JONES_COLS:
+        out_df[col] = np.random.randn(n_rows)+1j*np.random.randn(n_rows)
+    return (out_df)
+
+
+def make_scope_df(n_times, n_freqs):
+    '''
+    creates a dataframe of random linear polarisations, as read from HDF5
+    '''
+    times = pd.date_range("2018-03-01", periods=n_times, freq="519s")
+    freqs = 1e8+np.arange(n_freqs)*1e8/512
+    out_df = pd.DataFrame(data={"Time":np.repeat(times, n_freqs),
+                                "Freq":np.tile(freqs, n_times)})
+    n_rows = len(out_df)
+    out_df['xx'] = np.random.rand(n_rows)
+    out_df['xy'] = np.random.randn(n_rows)+1j*np.random.randn(n_rows)
+    out_df['yy'] = np.random.rand(n_rows)
+    return (out_df)
+
+
+def peak_memory(function_to_run, *args, **kwargs):
+    '''
+    runs a function and returns its output and the peak memory it allocated
+    in MB
+    '''
+    tracemalloc.start()
+    output = function_to_run(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (output, peak/1e6)
+
+
+def read_stages(model_df, scope_df, modes, inplace):
+    '''
+    calculates the polarisations and Stokes parameters as read_var_file does
+    '''
+    model_df = calc_xy(model_df, inplace=inplace)
+    model_df = calc_stokes(model_df, modes, inplace=inplace)
+    scope_df = calc_stokes(scope_df, modes, inplace=inplace)
+    return (model_df, scope_df)
+
+
+def fom_stage(merge_df, var_str, m_keys):
+    '''
+    calculates the figures of merit for each unique value as calc_fom_nd does
+    '''
+    return (calc_fom_table(merge_df, var_str, m_keys, "rmse"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        n_times = int(sys.argv[1])
+        n_freqs = int(sys.argv[2])
+    else:
+        n_times = 1000
+        n_freqs = 512
+
+    modes = {'verbose':0, 'crop_data':'b', 'norm_data':'b', 'crop':2.0,
+             'crop_type':'median', 'crop_basis':'f', 'norm':'f',
+             'align':'exact', 'time_tolerance':0.0, 'diff':'sub'}
+
+    print("Observation of "+str(n_times)+" times and "+str(n_freqs)+
+          " frequencies")
+
+    model_df = make_model_df(n_times, n_freqs)
+    scope_df = make_scope_df(n_times, n_freqs)
+    size = (model_df.memory_usage().sum()+scope_df.memory_usage().sum())/1e6
+    print("input dataframes:          "+str(round(size, 1))+" MB")
+
+    dfs, peak = peak_memory(read_stages, model_df.copy(), scope_df.copy(),
+                            modes, False)
+    print("read stages (copying):     "+str(round(peak, 1))+" MB")
+    dfs, peak = peak_memory(read_stages, model_df, scope_df, modes, True)
+    print("read stages (in place):    "+str(round(peak, 1))+" MB")
+    model_df, scope_df = dfs
+
+    merge_df, peak = peak_memory(merge_dfs, model_df, scope_df, modes)
+    print("merge stage:               "+str(round(peak, 1))+" MB")
+
+    foms, peak = peak_memory(fom_stage, merge_df, "Freq", ["xx", "yy", "I"])
+    print("figure of merit stage:     "+str(round(peak, 1))+" MB")
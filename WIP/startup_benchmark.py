@@ -0,0 +1,81 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Measures the start-up time of the comparison module in non-interactive mode
+(-I 0), and lists which of the slow optional packages were imported.
+
+Each measurement runs in a new Python process, so that previously imported
+modules are not reused.  Any further arguments are passed to the comparison
+module, e.g. model and scope files.
+
+usage: python startup_benchmark.py [n_runs] [comparison module arguments]
+
+@author: creanero
+"""
+import os
+import sys
+import subprocess
+
+MODULE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "comparison_module")
+
+HEAVY_MODULES = ["astropy", "casacore", "ilisa", "matplotlib", "seaborn",
+                 "scipy", "Tkinter", "tkinter"]
+
+# times the import and the run of main() separately, then lists the slow
+# packages that were imported
+RUN_SCRIPT = '''
+import sys
+import time
+start = time.time()
+import comparison_module_1_0
+import_time = time.time()-start
+sys.argv = ["comparison_module_1_0.py"]+%r
+try:
+    comparison_module_1_0.main()
+except SystemExit:
+    pass
+run_time = time.time()-start
+loaded = [module for module in %r if module in sys.modules]
+print("STARTUP %%f %%f %%s" %% (import_time, run_time, ",".join(loaded)))
+'''
+
+
+def time_startup(cm_args):
+    '''
+    runs the comparison module in a new process and returns the import time,
+    the total time and the slow packages that were imported
+    '''
+    script = RUN_SCRIPT % (cm_args, HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     cwd=MODULE_DIR,
+                                     stderr=subprocess.STDOUT)
+    for line in output.decode("utf-8", "replace").splitlines():
+        if line.startswith("STARTUP"):
+            parts = line.split(" ")
+            loaded = [module for module in parts[3].split(",") if module]
+            return (float(parts[1]), float(parts[2]), loaded)
+    raise RuntimeError("comparison module did not finish:\n"+
+                       output.decode("utf-8", "replace"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        n_runs = int(sys.argv[1])
+    else:
+        n_runs = 5
+    cm_args = ["-I", "0", "-V", "0"]+sys.argv[2:]
+
+    import_times = []
+    run_times = []
+    for i in range(n_runs):
+        import_time, run_time, loaded = time_startup(cm_args)
+        import_times.append(import_time)
+        run_times.append(run_time)
+
+    print("arguments: "+" ".join(cm_args))
+    print("import time (best of "+str(n_runs)+"): "+
+          str(round(min(import_times), 3))+"s")
+    print("total time (best of "+str(n_runs)+"):  "+
+          str(round(min(run_times), 3))+"s")
+    print("slow packages imported: "+(", ".join(loaded) or "none"))
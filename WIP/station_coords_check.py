@@ -0,0 +1,56 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Compares the vectorised conversion from horizontal to LOFAR station
+coordinates with the original per-sample casacore conversion on a random
+sample of directions.  Needs casacore and ilisa.
+
+usage: python station_coords_check.py [station_id] [n_points]
+
+@author: creanero
+"""
+import os
+import sys
+import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "comparison_module"))
+
+from alt_az_functions import horizon_to_station
+from alt_az_functions import horizon_to_station_casacore
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        stn_id = sys.argv[1]
+    else:
+        stn_id = "IE613"
+    if len(sys.argv) > 2:
+        n_points = int(sys.argv[2])
+    else:
+        n_points = 1000
+
+    az = np.random.uniform(0.0, 360.0, n_points)
+    # avoids the zenith, where the azimuth is undefined
+    el = np.random.uniform(0.0, 89.0, n_points)
+
+    start = datetime.datetime.now()
+    az_cc, el_cc = horizon_to_station_casacore(stn_id, az, el)
+    cc_time = (datetime.datetime.now()-start).total_seconds()
+
+    start = datetime.datetime.now()
+    az_np, el_np = horizon_to_station(stn_id, az, el)
+    np_time = (datetime.datetime.now()-start).total_seconds()
+
+    # azimuth differences are wrapped to +/-180 degrees
+    az_diff = (np.array(az_cc)-az_np+180.0) % 360.0-180.0
+    el_diff = np.array(el_cc)-el_np
+
+    print("casacore:   "+str(cc_time)+"s")
+    print("vectorised: "+str(np_time)+"s")
+    print("maximum azimuth difference:   "+
+          str(np.max(np.abs(az_diff))*3600)+" arcsec")
+    print("maximum elevation difference: "+
+          str(np.max(np.abs(el_diff))*3600)+" arcsec")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Prints the station and direction values used by test_alt_az_functions.py,
+with the station coordinates of each direction from the per-sample casacore
+conversion.  Needs casacore.
+
+The station is near IE613, with its axes turned by 7.5 degrees from the 
+local East and North at the geodetic latitude, as LOFAR station axes are.
+
+usage: python station_coords_reference.py
+
+@author: creanero
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "comparison_module"))
+
+from alt_az_functions import rotate_to_station
+from alt_az_functions import rotate_to_station_casacore
+
+
+if __name__ == "__main__":
+    # station position near IE613, in ITRF metres
+    stn_pos = np.array([[3801633.868], [-529022.268], [5076996.892]])
+
+    # local East, North and Up at the geodetic position of the station
+    lon = np.arctan2(stn_pos[1, 0], stn_pos[0, 0])
+    lat = np.deg2rad(53.0952)
+    east = np.array([-np.sin(lon), np.cos(lon), 0.0])
+    north = np.array([-np.sin(lat)*np.cos(lon), -np.sin(lat)*np.sin(lon),
+                      np.cos(lat)])
+    up = np.array([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon),
+                   np.sin(lat)])
+
+    # turns the station axes about the up axis
+    rot = np.deg2rad(7.5)
+    stn_rot = np.column_stack([np.cos(rot)*east-np.sin(rot)*north,
+                               np.sin(rot)*east+np.cos(rot)*north, up])
+
+    # random directions above the horizon, away from the zenith
+    rng = np.random.RandomState(613)
+    az = np.round(rng.uniform(0, 360, 12), 3)
+    el = np.round(rng.uniform(1, 89, 12), 3)
+
+    az_cc, el_cc = rotate_to_station_casacore(stn_pos, stn_rot, az, el)
+    az_np, el_np = rotate_to_station(stn_pos, stn_rot, az, el)
+
+    # azimuth differences are wrapped to +/-180 degrees
+    az_diff = (np.array(az_cc)-az_np+180.0) % 360.0-180.0
+    print("# maximum azimuth difference:   "+
+          str(np.max(np.abs(az_diff))*3600)+" arcsec")
+    print("# maximum elevation difference: "+
+          str(np.max(np.abs(np.array(el_cc)-el_np))*3600)+" arcsec")
+
+    np.set_printoptions(precision=17, floatmode='unique', linewidth=79)
+    print("STN_POS = "+repr(stn_pos))
+    print("STN_ROT = "+repr(stn_rot))
+    print("AZ = "+repr(az))
+    print("EL = "+repr(el))
+    print("AZ_CC = "+repr(np.array(az_cc)))
+    print("EL_CC = "+repr(np.array(el_cc)))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to reduce LOFAR array covariance cube (ACC) files to the power in
+the XX, XY and YY channels of the station beam, so that a folder of ACC files
+can be used as scope data without converting it to HDF5 first.
+
+@author: creanero
+"""
+import os
+import re
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# number of RCUs in the covariance matrices of an LBA station ACC file
+ACC_RCU_COUNT = 192
+# ACC files store each covariance as a little endian pair of 8 byte floats,
+# real then imaginary
+ACC_DTYPE = np.dtype('<c16')
+
+# ACC files are named YYYYMMDD_HHMMSS_acc_{subbands}x{rcus}x{rcus}.dat
+ACC_FILE_PATTERN = re.compile(r"(\d{8}_\d{6})_acc_(\d+)x(\d+)x(\d+)\.dat$")
+
+# ACC folders are named {STN_ID}_YYYYMMDD_HHMMSS_rcu{RCU_MODE}_..._acc
+ACC_RCU_PATTERN = re.compile(r"_rcu(\d)")
+
+# each subband of an ACC is integrated in turn for this many seconds, so the
+# subbands of a file are sampled at different times
+ACC_SUBBAND_INTERVAL = 1.0
+
+# lowest frequency and bandwidth in Hz of the 512 subbands in each RCU mode
+RCU_BANDS = {1:(0.0, 1e8), 2:(0.0, 1e8), 3:(0.0, 1e8), 4:(0.0, 1e8),
+             5:(1e8, 1e8), 6:(1.6e8, 8e7), 7:(2e8, 1e8)}
+
+
+def map_acc_file(acc_file, rcu_count=ACC_RCU_COUNT, subbands=None):
+    '''
+    Memory-maps a raw ACC file as a complex array of shape
+    (subbands, rcu_count, rcu_count), so that subbands are only read from
+    disk as they are indexed.  ACC files have no header, so if subbands is 
+    None, the number of subbands is calculated from the size of the file, and
+    any bytes after the last whole covariance matrix are ignored.
+
+    A ValueError is raised if the file does not hold at least one subband, or
+    the number of subbands given.
+    '''
+    matrix_size = rcu_count*rcu_count*ACC_DTYPE.itemsize
+    in_size = os.path.getsize(acc_file)
+    if subbands is None:
+        subbands = in_size//matrix_size
+
+    if subbands < 1 or in_size < subbands*matrix_size:
+        raise ValueError("file too small: "+acc_file)
+
+    return (np.memmap(acc_file, dtype=ACC_DTYPE, mode='r',
+                      shape=(subbands, rcu_count, rcu_count)))
+
+
+def is_acc_folder(folder):
+    '''
+    Returns True if a folder contains any ACC files
+    '''
+    return (any(ACC_FILE_PATTERN.search(file_name) is not None
+                for file_name in os.listdir(folder)))
+
+
+def get_acc_files(acc_folder, modes):
+    '''
+    Returns a list of the ACC files in a folder, sorted by time, as tuples of
+    the file name, the time of the file and the shape of its cube.
+
+    Files whose subbands are all outside the time window in modes are skipped.
+    '''
+    acc_files = []
+    for file_name in sorted(os.listdir(acc_folder)):
+        file_match = ACC_FILE_PATTERN.search(file_name)
+        if file_match is None:
+            continue
+
+        # the time in the file name is the start of the ACC
+        acc_time = pd.Timestamp(datetime.datetime.strptime(file_match.group(1),
+                                                           "%Y%m%d_%H%M%S"))
+        shape = tuple(int(file_match.group(i)) for i in range(2, 5))
+        if modes['time_window'] is not None:
+            acc_end = acc_time+pd.Timedelta(seconds=(shape[0]-1)*
+                                            ACC_SUBBAND_INTERVAL)
+            if (acc_end < pd.Timestamp(modes['time_window'][0]) or
+                acc_time > pd.Timestamp(modes['time_window'][1])):
+                continue
+
+        acc_files.append((os.path.join(acc_folder, file_name), acc_time,
+                          shape))
+
+    return (acc_files)
+
+
+def get_rcu_mode(acc_folder, modes):
+    '''
+    Returns the RCU mode from the name of an ACC folder, or 3 (LBA) if the
+    name does not include it
+    '''
+    rcu_match = ACC_RCU_PATTERN.search(os.path.basename(
+        os.path.normpath(acc_folder)))
+    if rcu_match is None or int(rcu_match.group(1)) not in RCU_BANDS:
+        if modes['verbose'] >=1:
+            print("WARNING: no RCU mode in the name of "+acc_folder+
+                  ", using RCU mode 3")
+        return (3)
+    return (int(rcu_match.group(1)))
+
+
+def get_acc_freqs(rcu_mode, subbands=512):
+    '''
+    Returns the centre frequencies in Hz of the subbands of an ACC file in a
+    given RCU mode.  Each subband is 1/512 of the bandwidth of the RCU mode.
+    '''
+    band_start, bandwidth = RCU_BANDS[rcu_mode]
+    return (band_start+np.arange(subbands)*bandwidth/512)
+
+
+def get_acc_times(acc_times, subband_numbers):
+    '''
+    Returns the time each subband was sampled for a list of ACC file start
+    times, as an array with one row per file and one column per subband.
+    subband_numbers are the positions of the subbands in the file, counted
+    from 0, which are sampled ACC_SUBBAND_INTERVAL seconds apart.
+    '''
+    start_times = np.array(acc_times, dtype='datetime64[ns]')
+    offsets = np.round(np.asarray(subband_numbers)*ACC_SUBBAND_INTERVAL*1e9)
+    return (start_times[:, np.newaxis]+
+            offsets.astype(np.int64).astype('timedelta64[ns]')[np.newaxis, :])
+
+
+def calc_acc_beam(acc_cube, weights=None):
+    '''
+    Calculates the power in the XX, XY and YY channels of the station beam
+    for each subband of an ACC cube of shape (subbands, rcu, rcu).
+
+    X-polarisation RCUs are even and Y-polarisation RCUs are odd, so XX is
+    formed from the covariances between even RCUs, YY between odd RCUs and XY
+    between even and odd RCUs.
+
+    weights are the complex beamforming weights of each antenna, either one
+    set for all subbands (antennas) or one set per subband (subbands,
+    antennas).  If weights is None, every antenna has a weight of one, which
+    is the beam at the zenith.
+
+    Returns the real XX and YY and complex XY powers as arrays with one value
+    per subband.
+    '''
+    x_x = acc_cube[:, 0::2, 0::2]
+    x_y = acc_cube[:, 0::2, 1::2]
+    y_y = acc_cube[:, 1::2, 1::2]
+
+    if weights is None:
+        # sums the covariances over both RCU axes of each subband
+        xx = np.sum(x_x, axis=(1, 2))
+        xy = np.sum(x_y, axis=(1, 2))
+        yy = np.sum(y_y, axis=(1, 2))
+    else:
+        weights = np.asarray(weights)
+        if weights.ndim == 1:
+            weights = np.broadcast_to(weights, (acc_cube.shape[0],
+                                                len(weights)))
+        # the power of the beam is w^H C w for each subband
+        xx = np.einsum('si,sij,sj->s', np.conj(weights), x_x, weights)
+        xy = np.einsum('si,sij,sj->s', np.conj(weights), x_y, weights)
+        yy = np.einsum('si,sij,sj->s', np.conj(weights), y_y, weights)
+
+    # the auto-correlation powers are real
+    return (np.real(xx), xy, np.real(yy))
@@ -3,70 +3,64 @@
 
 """
 Tool to visualise data from dreamBeam all sky mode
+
+usage: python all_sky_jones_reader.py [-h] [--out_dir OUT_DIR]
+                                      [--three_d {colour,contour}]
+                                      in_file
 """
 
-import pandas as pd
+import argparse
+
 import numpy as np
-from reading_functions import calc_xy
+from reading_functions import read_all_sky_jones
 from reading_functions import calc_stokes
 from graphing_functions import plot_3d_graph
 
 np.seterr(divide='ignore', invalid='ignore')
 
-def read_odd(in_line):
-    split_line=in_line.split(" ")
-    jones_strs=split_line[1:5]
-    jones_outs=[]
-    for jones in jones_strs:
-        jones_outs.append(complex(jones))
-    return(jones_outs)
-
-
-def read_even(in_line):
-    split_line=in_line.split(" ")
-    alt_az_strs=split_line[2:4]
-    alt_az_outs=[]
-    for alt_az in alt_az_strs:
-        alt_az_outs.append(np.degrees(float(alt_az)))
-    return(alt_az_outs)
-
-
-#in_file_name=raw_input("Please enter the file name for reading:\t")
-in_file_name="/home/creanero/outputs/test/dreamBeam/2018-10-15/FoV_jones/test.out" #for quick testing
-in_file=open(in_file_name, "r")
-out_dir_name="/home/creanero/outputs/test/dreamBeam/2018-10-15/FoV_jones/" #for quick testing
 
-in_lines=in_file.readlines()
+def all_sky_arg_parser():
+    '''
+    Reads the command line arguments for the all-sky tool and returns them
+    '''
+    parser = argparse.ArgumentParser(description='''
+Plots the channels and Stokes parameters of a DreamBeam all-sky .out file
+against azimuth and altitude.
+                                     ''')
 
-in_file.close()
+    parser.add_argument("in_file",
+                        help='''
+The DreamBeam all-sky .out file to read
+                        ''')
 
-jones_line = [0,0,0,0]
-alt_az_line=[0,0]
+    parser.add_argument("--out_dir", "-o", default=None,
+                        help='''
+Directory to save the plots to.  Default is to display them on screen
+                        ''')
 
-out_list=[]
+    parser.add_argument("--three_d", "-3", default="colour",
+                        choices=("colour", "contour"),
+                        help='''
+Type of plot of the values over the sky.  Default is colour
+                        ''')
 
-modes={'verbose':2,'three_d':'colour','title':'','title_':'','out_dir':out_dir_name,'image_type':'png'}
-source=""
+    return (parser.parse_args())
 
-for line_index in range(len(in_lines)):
-    if line_index % 2: #line_index % 2 = 1 i.e. odd
-        jones_line=read_odd(in_lines[line_index])
-        out_line = alt_az_line + jones_line
-        out_list.append(out_line)
-    else: #line_index % 2 = 0 i.e. even
-        alt_az_line=read_even(in_lines[line_index])
-headers=["az","alt","J11","J12","J21","J22"]
 
-out_df=pd.DataFrame(out_list, columns=headers)
+if __name__ == "__main__":
+    args = all_sky_arg_parser()
 
-out_df=calc_xy(out_df)
-out_df=calc_stokes(out_df,modes)
+    modes={'verbose':2,'three_d':args.three_d,'title':'','title_':'',
+           'out_dir':args.out_dir,'image_type':'png','colour':'default',
+           'dpi':None,'image_size':None,'scale':'linear'}
+    source=""
 
-keys=["xx","xy","yy","U","V","I","Q"]
+    out_df=read_all_sky_jones(args.in_file, modes)
+    out_df=calc_stokes(out_df,modes,inplace=True)
 
+    keys=["xx","xy","yy","U","V","I","Q"]
 
-var_x='az'
-var_y='alt'
-for key in keys:
-    plot_3d_graph(out_df, key, modes, source, var_x, var_y)
-#print(out_df)
+    var_x='az'
+    var_y='alt'
+    for key in keys:
+        plot_3d_graph(out_df, key, modes, source, var_x, var_y)
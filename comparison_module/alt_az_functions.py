@@ -5,41 +5,73 @@ Created on Wed Jun 27 10:03:28 2018
 @author: User
 """
 
+try:
+    import numpy as np
+except ImportError:
+    print("WARNING: unable to import numpy.\n"\
+      "This may cause subsequent modules to fail")
+
+import pandas as pd
+
+from cache_functions import get_ephemeris_file
+from cache_functions import read_cache
+from cache_functions import write_cache
+
+
 ###############################################################################
 #
-#coordinate setting functions
+#deferred imports
 #    
 ###############################################################################
+# astropy, casacore and ilisa are slow to import, so they are only imported 
+# when coordinates are first calculated.  If an import fails, a warning is 
+# printed and the names are left undefined, so that the calculation fails 
+# with a NameError
 #TODO see if import warnings can be suppressed without passing arguments
-try:
-    from astropy.coordinates import EarthLocation,SkyCoord
-    from astropy.time import Time
-    from astropy import units as u
-    from astropy.coordinates import AltAz
-except ImportError:
-    print("WARNING: Unable to import astropy.\n"\
-          "This may cause subsequent modules to fail")
-    
-try:
-    import casacore.measures
-    import casacore.quanta.quantity
 
-except ImportError:
-    print("WARNING: Unable to import casacore.\n"\
-          "This may cause subsequent modules to fail")
-    
-try:    
-    import ilisa.antennameta.antennafieldlib as antennafieldlib
+def import_astropy():
+    '''
+    imports the astropy names used to calculate horizontal coordinates
+    '''
+    global EarthLocation, SkyCoord, Time, u, AltAz
+    try:
+        from astropy.coordinates import EarthLocation,SkyCoord
+        from astropy.time import Time
+        from astropy import units as u
+        from astropy.coordinates import AltAz
+    except ImportError:
+        print("WARNING: Unable to import astropy.\n"\
+              "This may cause subsequent modules to fail")
 
-except ImportError:
-    print("WARNING: unable to import ilisa.\n"\
-          "This may cause subsequent modules to fail")
-try:
-    import numpy as np
-except ImportError:
-    print("WARNING: unable to import numpy.\n"\
-      "This may cause subsequent modules to fail")
+def import_casacore():
+    '''
+    imports the casacore modules used to convert to station coordinates
+    '''
+    global casacore
+    try:
+        import casacore.measures
+        import casacore.quanta.quantity
+    except ImportError:
+        print("WARNING: Unable to import casacore.\n"\
+              "This may cause subsequent modules to fail")
 
+def import_ilisa():
+    '''
+    imports the ilisa module giving the positions and rotations of stations
+    '''
+    global antennafieldlib
+    try:    
+        import ilisa.antennameta.antennafieldlib as antennafieldlib
+    except ImportError:
+        print("WARNING: unable to import ilisa.\n"\
+              "This may cause subsequent modules to fail")
+
+
+###############################################################################
+#
+#coordinate setting functions
+#    
+###############################################################################
 
 def set_coords(name_str,verbose = 1):
     '''
@@ -103,30 +135,174 @@ def calc_alt_az_all_sky(in_df, modes):
 def calc_alt_az(merge_df,modes):
     '''
     This function uses astropy to calculate a set of altitude and azimuth 
-    coordinates for the target object at each time in the the dataset
+    coordinates for the target object at each time in the the dataset.  If 
+    the coordinate engine is set to fast, fast_alt_az is used instead.  If a 
+    coordinate interval is set, the coordinates are interpolated between 
+    knots at that interval using interp_alt_az
     '''
-    if modes['verbose'] >=2:
-        print("Calculating Horizontal Coordinates")
-    observing_location = EarthLocation(lat= modes['location_coords'][0],
-                                       lon= modes['location_coords'][1],
-                                       height =modes['location_coords'][2]*u.m)
+    # the coordinates only depend on the time, so they are calculated once 
+    # for each unique time and broadcast back to every row
+    time_index, time_inverse = get_unique_times(merge_df)
+    unique_times = merge_df.Time.values[time_index]
+    
+    # checks for coordinates cached from a previous run
+    cache_file = get_ephemeris_file("alt_az_"+modes['coord_engine'], 
+                                    (modes['location_coords'],
+                                     modes['object_coords'],
+                                     modes['coord_interval']),
+                                    unique_times, modes)
+    alt_az_df = None
+    if cache_file is not None:
+        alt_az_df = read_cache(cache_file, modes)
+    
+    if alt_az_df is None:
+        if modes['coord_interval'] > 0:
+            alt, az = interp_alt_az(unique_times, modes)
+        else:
+            alt, az = get_alt_az_values(unique_times, modes)
+        alt_az_df = pd.DataFrame({'alt':alt, 'az':az}, columns=['alt','az'])
+        
+        if modes['verbose'] >=2:
+            print("Calculating East/West Horizontal Coordinates")
+        alt_az_df['az_ew'] = np.where(alt_az_df.az>180, alt_az_df.az-360, 
+                                      alt_az_df.az)
+        
+        if cache_file is not None:
+            write_cache(alt_az_df, cache_file, modes)
     
-    coord = SkyCoord(modes['object_coords'][0],
-                     modes['object_coords'][1], 
-                     unit='deg')
+    for col in ['alt', 'az', 'az_ew']:
+        merge_df[col] = alt_az_df[col].values[time_inverse]
+    return (merge_df)
+
+def get_alt_az_values(times, modes):
+    '''
+    This function calculates the altitude and azimuth of the target object in
+    degrees for an array of datetime64 times, using the coordinate engine 
+    set in modes
+    '''
+    if modes['coord_engine'] == "fast":
+        if modes['verbose'] >=2:
+            print("Calculating Horizontal Coordinates (fast)")
+        alt, az = fast_alt_az(times, modes['location_coords'], 
+                              modes['object_coords'])
+    else:
+        if modes['verbose'] >=2:
+            print("Calculating Horizontal Coordinates")
+        import_astropy()
+        observing_location = EarthLocation(lat= modes['location_coords'][0],
+                                           lon= modes['location_coords'][1],
+                                           height =modes['location_coords'][2]*u.m)
+        
+        coord = SkyCoord(modes['object_coords'][0],
+                         modes['object_coords'][1], 
+                         unit='deg')
+        
+        time_set = Time(list(pd.to_datetime(times)))
+        aa_set= AltAz(location=observing_location, obstime=time_set)
+        coord_set=coord.transform_to(aa_set)
+        
+        alt = coord_set.alt.deg
+        az = coord_set.az.deg
+    return (alt, az)
+
+def interp_alt_az(times, modes):
+    '''
+    This function calculates the altitude and azimuth of the target object 
+    exactly only at knots spaced by the coordinate interval (in minutes) 
+    across the sorted array of datetime64 times, and interpolates them to 
+    all the times with a cubic spline.  
     
-    time_set = Time(list(merge_df.Time))
-    aa_set= AltAz(location=observing_location, obstime=time_set)
-    coord_set=coord.transform_to(aa_set)
+    The azimuth is unwrapped before interpolation, so that it can cross 
+    0/360 degrees.  As the azimuth changes quickly near the zenith, the 
+    interval should be kept short for targets that pass close to it.
+    '''
+    # times in seconds since the first time
+    time_ns = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+    rel_times = (time_ns - time_ns[0])/1e9
     
-    merge_df['alt'] = coord_set.alt
-    merge_df['az'] = coord_set.az
+    n_knots = int(np.ceil(rel_times[-1]/(modes['coord_interval']*60.0)))+1
+    # there is nothing to gain if there are as many knots as times
+    if n_knots < 4 or n_knots >= len(rel_times):
+        return (get_alt_az_values(times, modes))
     
-    merge_df['az_ew'] = coord_set.az
     if modes['verbose'] >=2:
-        print("Calculating East/West Horizontal Coordinates")
-    (merge_df.loc[merge_df['az']>180,'az_ew'])=(merge_df.loc[merge_df['az']>180,'az'])-360
-    return (merge_df)
+        print("Interpolating Horizontal Coordinates from "+str(n_knots)+
+              " knots")
+    knot_times = np.linspace(0.0, rel_times[-1], n_knots)
+    knot_datetimes = (time_ns[0] + np.round(knot_times*1e9).astype(np.int64)
+                      ).astype('datetime64[ns]')
+    knot_alt, knot_az = get_alt_az_values(knot_datetimes, modes)
+    
+    from scipy.interpolate import CubicSpline
+    
+    alt = CubicSpline(knot_times, knot_alt)(rel_times)
+    knot_az = np.rad2deg(np.unwrap(np.deg2rad(knot_az)))
+    az = np.mod(CubicSpline(knot_times, knot_az)(rel_times), 360.0)
+    return (alt, az)
+
+def fast_alt_az(times, location_coords, object_coords):
+    '''
+    This function calculates the altitude and azimuth (in degrees, azimuth 
+    measured North through East) of a target with J2000 RA and Dec 
+    object_coords, from a site at latitude and longitude location_coords, 
+    for an array of datetime64 UTC times.
+    
+    The RA and Dec are precessed to the date, and the hour angle is found 
+    from the Greenwich mean sidereal time.  Nutation, aberration, UT1-UTC, 
+    polar motion and refraction are ignored, so the positions agree with the 
+    astropy AltAz transform to within 1 arcminute on the sky (about 0.5 
+    arcminutes for the LOFAR stations and targets defined in set_coords).  
+    Near the zenith, azimuth errors are correspondingly larger.
+    '''
+    # Julian date of each time, from seconds since the Unix epoch
+    seconds = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)/1e9
+    jd = seconds/86400.0 + 2440587.5
+    # Julian centuries since J2000
+    t_cent = (jd - 2451545.0)/36525.0
+    
+    # precesses the RA and Dec from J2000 to the date 
+    # (IAU 1976 precession angles, in arcseconds)
+    zeta = np.deg2rad((2306.2181*t_cent + 0.30188*t_cent**2 + 
+                       0.017998*t_cent**3)/3600.0)
+    z = np.deg2rad((2306.2181*t_cent + 1.09468*t_cent**2 + 
+                    0.018203*t_cent**3)/3600.0)
+    theta = np.deg2rad((2004.3109*t_cent - 0.42665*t_cent**2 - 
+                        0.041833*t_cent**3)/3600.0)
+    ra0 = np.deg2rad(object_coords[0])
+    dec0 = np.deg2rad(object_coords[1])
+    a_vec = np.cos(dec0)*np.sin(ra0+zeta)
+    b_vec = (np.cos(theta)*np.cos(dec0)*np.cos(ra0+zeta) - 
+             np.sin(theta)*np.sin(dec0))
+    c_vec = (np.sin(theta)*np.cos(dec0)*np.cos(ra0+zeta) + 
+             np.cos(theta)*np.sin(dec0))
+    ra = np.arctan2(a_vec, b_vec) + z
+    dec = np.arcsin(np.clip(c_vec, -1.0, 1.0))
+    
+    # Greenwich mean sidereal time, and the local hour angle of the target
+    gmst = (280.46061837 + 360.98564736629*(jd - 2451545.0) + 
+            0.000387933*t_cent**2 - t_cent**3/38710000.0)
+    hour_angle = np.deg2rad(gmst + location_coords[1]) - ra
+    
+    lat = np.deg2rad(location_coords[0])
+    alt = np.arcsin(np.clip(np.sin(lat)*np.sin(dec) + 
+                            np.cos(lat)*np.cos(dec)*np.cos(hour_angle), 
+                            -1.0, 1.0))
+    az = np.arctan2(-np.cos(dec)*np.sin(hour_angle),
+                    np.sin(dec)*np.cos(lat) - 
+                    np.cos(dec)*np.cos(hour_angle)*np.sin(lat))
+    
+    return (np.rad2deg(alt), np.mod(np.rad2deg(az), 360.0))
+
+def get_unique_times(merge_df):
+    '''
+    This function returns the index of the first row for each unique time in 
+    the dataset, sorted by time, and the position of the time of each row 
+    among those unique times
+    '''
+    unique_times, time_index, time_inverse = np.unique(merge_df.Time.values,
+                                                       return_index=True, 
+                                                       return_inverse=True)
+    return (time_index, time_inverse.ravel())
 
 def calc_alt_az_lofar(merge_df,modes):
     '''
@@ -136,26 +312,135 @@ def calc_alt_az_lofar(merge_df,modes):
     if modes['verbose'] >=2:
         print("Calculating LOFAR Coordinates")
     stn_id=modes['location_name']
-    stn_alt_az=horizon_to_station(stn_id, merge_df['az'], merge_df['alt'])
+    # converts the coordinates once for each unique time
+    time_index, time_inverse = get_unique_times(merge_df)
+    unique_times = merge_df.Time.values[time_index]
     
-    merge_df['stn_alt']=np.array(stn_alt_az[1])
-    merge_df['stn_az_ew']=np.array(stn_alt_az[0])
-    merge_df['stn_az']=merge_df['stn_az_ew']
-    (merge_df.loc[merge_df['stn_az_ew']<0,'stn_az'])=(merge_df.loc[merge_df['stn_az_ew']<0,'stn_az_ew'])+360
+    # checks for coordinates cached from a previous run.  These are converted
+    # from the alt/az calculated by calc_alt_az, so depend on its options too
+    cache_file = get_ephemeris_file("stn_alt_az_"+modes['coord_engine'], 
+                                    (stn_id, 
+                                     modes['location_coords'],
+                                     modes['object_coords'],
+                                     modes['coord_interval']),
+                                    unique_times, modes)
+    stn_df = None
+    if cache_file is not None:
+        stn_df = read_cache(cache_file, modes)
+    
+    if stn_df is None:
+        stn_alt_az=horizon_to_station(stn_id, 
+                                      merge_df['az'].values[time_index], 
+                                      merge_df['alt'].values[time_index])
+        
+        stn_df = pd.DataFrame({'stn_alt':np.array(stn_alt_az[1]),
+                               'stn_az_ew':np.array(stn_alt_az[0])},
+                              columns=['stn_alt','stn_az_ew'])
+        stn_df['stn_az'] = np.where(stn_df.stn_az_ew<0, stn_df.stn_az_ew+360,
+                                    stn_df.stn_az_ew)
+        
+        if cache_file is not None:
+            write_cache(stn_df, cache_file, modes)
+    
+    for col in ['stn_alt', 'stn_az_ew', 'stn_az']:
+        merge_df[col] = stn_df[col].values[time_inverse]
     return (merge_df)
 
 def horizon_to_station(stnid, refAz, refEl):
-    # Algorithm does not depend on time but need it for casacore call.
-    obstimestamp = "2000-01-01T12:00:00" 
+    '''
+    This function converts horizontal azimuth and elevation (in degrees) to
+    the azimuth and elevation in the LOFAR station coordinate system of stnid.
 
+    The conversion does not depend on time, so rather than converting each
+    direction with casacore, all the directions are converted at once by 
+    rotate_to_station.  horizon_to_station_casacore gives the original 
+    conversion.
+    '''
+    import_ilisa()
+    # Use antennafieldlib to get station position and rotation
+    # (using HBA here but it shouldn't matter much if it were LBA)
+    stnPos, stnRot, arrcfgpos_ITRF, stnIntilePos = \
+                         antennafieldlib.getArrayBandParams(stnid, 'HBA')
 
-    obsstate = casacore.measures.measures()
-    when = obsstate.epoch("UTC", obstimestamp)
+    return(rotate_to_station(stnPos, stnRot, refAz, refEl))
+
+def rotate_to_station(stnPos, stnRot, refAz, refEl):
+    '''
+    This function converts horizontal azimuth and elevation (in degrees) to
+    the azimuth and elevation in the coordinate system of a station at the
+    ITRF position stnPos with the rotation matrix stnRot.
+
+    All the directions are converted from the local horizon to ITRF unit 
+    vectors at once, and rotated by the station's rotation matrix in a single
+    matrix product.  As in the casacore AZEL frame, the local vertical uses 
+    the geocentric latitude of the station.  No polar motion is applied, and
+    the results agree with rotate_to_station_casacore to well within a 
+    milliarcsecond.
+    '''
+    stnPos = np.asarray(stnPos, dtype=float).ravel()
+    stnRot = np.asarray(stnRot, dtype=float)
+
+    # geocentric longitude and latitude of the station
+    lon = np.arctan2(stnPos[1], stnPos[0])
+    lat = np.arctan2(stnPos[2], np.hypot(stnPos[0], stnPos[1]))
+
+    # unit vectors of the local East, North and Up directions in ITRF
+    east = np.array([-np.sin(lon), np.cos(lon), 0.0])
+    north = np.array([-np.sin(lat)*np.cos(lon), -np.sin(lat)*np.sin(lon),
+                      np.cos(lat)])
+    up = np.array([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon),
+                   np.sin(lat)])
+
+    # converts all the directions to ITRF unit vectors (one per column)
+    az = np.deg2rad(np.asarray(refAz, dtype=float))
+    el = np.deg2rad(np.asarray(refEl, dtype=float))
+    xyzITRF = (np.outer(east, np.cos(el)*np.sin(az)) +
+               np.outer(north, np.cos(el)*np.cos(az)) +
+               np.outer(up, np.sin(el)))
+
+    # then rotates them all using station's rotation matrix
+    what_stn = np.dot(stnRot.T, xyzITRF)
+    l_stn = what_stn[0]
+    m_stn = what_stn[1]
+    n_stn = np.clip(what_stn[2], -1.0, 1.0)
+
+    # now convert vectors in station local coordinate system to az/el
+    az_stn = np.rad2deg(np.arctan2(l_stn, m_stn))
+    el_stn = np.rad2deg(np.arcsin(n_stn))
+
+    return(az_stn, el_stn)
+
+def horizon_to_station_casacore(stnid, refAz, refEl):
+    '''
+    This function converts horizontal azimuth and elevation to station
+    coordinates by converting each direction with casacore.  It is much
+    slower than horizon_to_station and is kept to check its results.
+    '''
+    import_ilisa()
     # Use antennafieldlib to get station position and rotation
     # (using HBA here but it shouldn't matter much if it were LBA)
     stnPos, stnRot, arrcfgpos_ITRF, stnIntilePos = \
                          antennafieldlib.getArrayBandParams(stnid, 'HBA')
 
+    return(rotate_to_station_casacore(stnPos, stnRot, refAz, refEl))
+
+def rotate_to_station_casacore(stnPos, stnRot, refAz, refEl):
+    '''
+    This function converts horizontal azimuth and elevation to the coordinates
+    of a station at the ITRF position stnPos with the rotation matrix stnRot,
+    by converting each direction to ITRF with casacore.  It gives the 
+    reference values for rotate_to_station.
+    '''
+    import_casacore()
+    stnPos = np.asarray(stnPos, dtype=float).reshape(3, 1)
+    stnRot = np.matrix(stnRot)
+    # Algorithm does not depend on time but need it for casacore call.
+    obstimestamp = "2000-01-01T12:00:00" 
+
+
+    obsstate = casacore.measures.measures()
+    when = obsstate.epoch("UTC", obstimestamp)
+
     # Convert from ITRF to LOFAR station coordsys
     #arrcfgpos_stncrd = stnRot.T * arrcfgpos_ITRF.T
     pos_ITRF_X = str(stnPos[0,0])+'m'
@@ -4,13 +4,17 @@ Created on Fri Jun 15 13:51:56 2018
 
 @author: User
 """
+import multiprocessing
+
 import pandas as pd
 
 from graphing_functions import plots_1f
-from graphing_functions import plot_spectra_nf
+from graphing_functions import spectra_plot_jobs
 from graphing_functions import calc_fom_1d
-from graphing_functions import calc_fom_nd
-from graphing_functions import plot_altaz_values_nf
+from graphing_functions import calc_fom_table
+from graphing_functions import plot_fom_nd
+from graphing_functions import altaz_plot_jobs
+from graphing_functions import render_plots
 
 from appearance_functions import channel_maker
 from appearance_functions import gen_pretty_name
@@ -112,17 +116,21 @@ def analysis_nd(merge_df,modes, m_keys,sources):
         print("Carrying out multi-frequency Analysis")
     
   
+    # collects the spectra and alt-az plots so they can be rendered together
+    plot_jobs = []
     if "spectra" in modes["plots"]:
-        plot_spectra_nf(merge_df, m_keys, modes, sources)
+        plot_jobs.extend(spectra_plot_jobs(merge_df, m_keys, modes, sources))
     
     if any (plot in modes["plots"] for plot in ["alt","az","ew"]):
         if all(coord in merge_df for coord in ["alt","az","az_ew"]) :
 
-            plot_altaz_values_nf(merge_df, m_keys, modes, sources)
+            plot_jobs.extend(altaz_plot_jobs(merge_df, m_keys, modes, sources))
             
         else:
             if modes['verbose'] >=1:
                 print("Warning: Alt-Azimuth plotting selected, but not available!")
+
+    render_plots(plot_jobs, modes)
     
     #calculates the figures of merit at each independent variable 
     #return values are stored as possible future outputs
@@ -138,9 +146,12 @@ def analysis_nd(merge_df,modes, m_keys,sources):
             foms.append("rmse")
  
 
+        # calculates all the figures of merit before plotting them
+        fom_tables = calc_fom_vs_ind(merge_df, m_keys, modes, foms)
+        render_plots(fom_plot_jobs(fom_tables, m_keys, modes), modes)
+        ind_dfs = get_ind_dfs(fom_tables)
+
         for fom in foms:
-            ind_dfs=plot_fom_vs_ind(merge_df, m_keys, modes, fom)
-                        
             #calculates the overall figure of merit between scope and model
             fom_1=calc_fom_1d(merge_df, m_keys,fom)
             #prints that coefficient for each key and correlation
@@ -188,8 +199,17 @@ def plot_fom_vs_ind(merge_df, m_keys, modes, fom):
     """
     plots various figures of merit against available independent variables
     """
-    ind_dfs = {}
+    fom_tables = calc_fom_vs_ind(merge_df, m_keys, modes, [fom])
+    render_plots(fom_plot_jobs(fom_tables, m_keys, modes), modes)
     
+    return (get_ind_dfs(fom_tables))
+
+
+def get_ind_vars(merge_df, modes):
+    """
+    returns the list of independent variables to calculate figures of merit
+    against
+    """
     ind_var = []
     
     alt_var,az_var,az_var_ew = get_alt_az_var(merge_df, modes)
@@ -219,16 +239,79 @@ def plot_fom_vs_ind(merge_df, m_keys, modes, fom):
     else: # if the altitude and azimuth are unavailable but not requested
         pass # nothing to do
     
-    
-    for ind in ind_var:        
+    return (ind_var)
+
+
+def calc_fom_vs_ind(merge_df, m_keys, modes, foms):
+    """
+    calculates the figures of merit against the available independent 
+    variables, and any splits of them.
+
+    If more than one job is set, the calculations for each independent 
+    variable, split and figure of merit are carried out in a pool of 
+    processes, each of which is passed only the columns it needs.
+
+    Returns a list of tuples of the independent variable, the name of the 
+    split, the figure of merit and a dataframe of its values
+    """
+    fom_jobs = []
+    for ind in get_ind_vars(merge_df, modes):
         splits, names = split_df(merge_df, modes, ind)
         for i in range(len(splits)):
-            n_ind=splits[i][ind].unique()   
-            ind_df=pd.DataFrame(data={ind:n_ind})
-            n_foms=calc_fom_nd(splits[i],ind, m_keys, modes, fom)
-            for key in m_keys:
-                ind_df[key+'_'+fom]=n_foms[m_keys.index(key)]
-            ind_dfs[ind+names[i]+"_"+fom]=ind_df
+            for fom in foms:
+                if fom == "rmse":
+                    cols = [key+'_diff' for key in m_keys]
+                else:
+                    cols = ([key+'_model' for key in m_keys]+
+                            [key+'_scope' for key in m_keys])
+                fom_jobs.append((splits[i][[ind]+cols], ind, m_keys, fom,
+                                 names[i]))
+
+    n_jobs = min(modes['jobs'], len(fom_jobs))
+    if n_jobs <= 1:
+        fom_dfs = [calc_fom_job(fom_job) for fom_job in fom_jobs]
+    else:
+        if modes['verbose'] >=2:
+            print("Calculating "+str(len(fom_jobs))+" figures of merit in "+
+                  str(n_jobs)+" processes")
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            fom_dfs = pool.map(calc_fom_job, fom_jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
     
-    return (ind_dfs)
+    fom_tables = []
+    for i in range(len(fom_jobs)):
+        ind, fom, name = fom_jobs[i][1], fom_jobs[i][3], fom_jobs[i][4]
+        fom_tables.append((ind, name, fom, fom_dfs[i]))
+    return (fom_tables)
+
+
+def calc_fom_job(fom_job):
+    """
+    calculates the figure of merit table for one job from calc_fom_vs_ind
+    """
+    return (calc_fom_table(fom_job[0], fom_job[1], fom_job[2], fom_job[3]))
+
 
+def fom_plot_jobs(fom_tables, m_keys, modes):
+    """
+    returns the list of plots of the figures of merit from calc_fom_vs_ind, 
+    as used by render_plots
+    """
+    plot_jobs = []
+    for ind, name, fom, fom_df in fom_tables:
+        plot_jobs.append((plot_fom_nd, fom_df, ind, m_keys, modes, fom, name))
+    return (plot_jobs)
+
+
+def get_ind_dfs(fom_tables):
+    """
+    returns a dictionary of the figure of merit dataframes from 
+    calc_fom_vs_ind, named by independent variable, split and figure of merit
+    """
+    ind_dfs = {}
+    for ind, name, fom, fom_df in fom_tables:
+        ind_dfs[ind+name+"_"+fom] = fom_df
+    return (ind_dfs)
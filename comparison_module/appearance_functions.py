@@ -4,10 +4,6 @@ Created on Fri Jun 15 13:13:45 2018
 
 @author: User
 """
-import seaborn as sns
-
-import matplotlib.pyplot as plt
-
 def gen_pretty_name(key,units=False):
     '''
     This function generates suitable names for graph titles and axes from the 
@@ -101,6 +97,11 @@ def colour_models(colour_id):
     '''
     The colours used are defined in a function that returns the colour strings
     '''
+    # seaborn and matplotlib are imported here rather than with the module,
+    # so that the names in this module can be used without loading them
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    
     #sets oranges for various applications for the p channel
     if colour_id in ['p','p_diff']:
         return('orange')
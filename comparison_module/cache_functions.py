@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to store parsed input files and calculated coordinates in a binary
+cache so that repeated runs against the same observation do not need to parse
+the files or calculate the coordinates again.
+
+@author: creanero
+"""
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# version of the cached data.  This must be incremented whenever the readers
+# or the calculation of the Stokes parameters change, so that stale cache
+# files are not reused
+CACHE_VERSION = 1
+
+
+def get_cache_file(file_name, modes):
+    '''
+    Returns the path of the cache file for an input file, or None if caching
+    is not enabled or the input file does not exist.
+
+    The cache file name includes a hash of the absolute path, modification
+    time and size of the input file, the cache version and the read window, so
+    a changed file or a different window never reuses an old cache.
+    '''
+    if modes['cache_dir'] is None or not os.path.isfile(file_name):
+        return (None)
+
+    file_stat = os.stat(file_name)
+    key = repr((os.path.abspath(file_name), file_stat.st_mtime,
+                file_stat.st_size, CACHE_VERSION,
+                modes['time_window'], modes['subband_window']))
+    key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    cache_name = os.path.basename(file_name).replace('.', '_')+"_"+key_hash+".npz"
+    return (os.path.join(modes['cache_dir'], cache_name))
+
+
+def get_ephemeris_file(name, coord_key, times, modes):
+    '''
+    Returns the path of the cache file for coordinates calculated for a set of
+    times, or None if caching is not enabled.
+
+    The cache file name includes a hash of coord_key, which identifies the
+    site and target, the cache version and the times themselves.
+    '''
+    if modes['cache_dir'] is None:
+        return (None)
+
+    key_hash = hashlib.sha1(repr((name, coord_key, CACHE_VERSION)).encode('utf-8'))
+    # hashes the times as integer nanoseconds
+    key_hash.update(np.ascontiguousarray(
+        np.asarray(times, dtype='datetime64[ns]').view(np.int64)).tobytes())
+
+    cache_name = name+"_"+key_hash.hexdigest()[:16]+".npz"
+    return (os.path.join(modes['cache_dir'], "ephemeris", cache_name))
+
+
+def read_cache(cache_file, modes):
+    '''
+    Reads a dataframe from a cache file.  Returns None if the file does not
+    exist or cannot be read.
+    '''
+    if not os.path.isfile(cache_file):
+        return (None)
+
+    if modes['verbose'] >=2:
+        print("Reading cached data: "+cache_file)
+    try:
+        with np.load(cache_file, allow_pickle=False) as cache_data:
+            columns = [str(col) for col in cache_data['columns']]
+            data = {}
+            for i in range(len(columns)):
+                data[columns[i]] = cache_data['col_'+str(i)]
+    except (IOError, ValueError, KeyError):
+        if modes['verbose'] >=1:
+            print("WARNING: unable to read cache file:\n\t"+cache_file)
+        return (None)
+
+    # marks the cache file as recently used
+    try:
+        os.utime(cache_file, None)
+    except OSError:
+        pass
+
+    return (pd.DataFrame(data=data, columns=columns))
+
+
+def write_cache(in_df, cache_file, modes):
+    '''
+    Writes the columns of a dataframe to a cache file as NumPy arrays.
+    Dataframes with columns that cannot be stored without pickling are not
+    cached.
+    '''
+    if any(in_df[col].values.dtype.kind == 'O' for col in in_df):
+        if modes['verbose'] >=2:
+            print("Not caching data with object columns")
+        return
+
+    if modes['verbose'] >=2:
+        print("Writing cached data: "+cache_file)
+
+    arrays = {'columns':np.array([str(col) for col in in_df.columns])}
+    for i in range(len(in_df.columns)):
+        arrays['col_'+str(i)] = in_df[in_df.columns[i]].values
+
+    # writes to a temporary file first so that a partial cache is never read
+    temp_file = cache_file+".tmp"
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir != "" and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(temp_file, 'wb') as out_file:
+            np.savez(out_file, **arrays)
+        os.rename(temp_file, cache_file)
+    except (IOError, OSError):
+        if modes['verbose'] >=1:
+            print("WARNING: unable to write cache file:\n\t"+cache_file)
+        return
+
+    prune_cache(modes, keep_file=cache_file)
+
+
+def prune_cache(modes, keep_file=None):
+    '''
+    Deletes the least recently used files in the cache directory until its 
+    size is no more than modes['cache_size'] MB.  The file keep_file, which 
+    has just been written, is never deleted.
+    '''
+    cache_files = []
+    for dir_path, dir_names, file_names in os.walk(modes['cache_dir']):
+        for file_name in file_names:
+            if file_name.endswith(".npz"):
+                full_name = os.path.join(dir_path, file_name)
+                try:
+                    file_stat = os.stat(full_name)
+                except OSError:
+                    continue
+                cache_files.append((file_stat.st_mtime, file_stat.st_size,
+                                    full_name))
+
+    total_size = sum(cache_file[1] for cache_file in cache_files)
+    max_size = modes['cache_size']*1e6
+    # deletes the files used longest ago first
+    for mtime, size, full_name in sorted(cache_files):
+        if total_size <= max_size:
+            break
+        if keep_file is not None and os.path.abspath(full_name) == \
+            os.path.abspath(keep_file):
+            continue
+        if modes['verbose'] >=2:
+            print("Removing cache file: "+full_name)
+        try:
+            os.remove(full_name)
+            total_size -= size
+        except OSError:
+            pass
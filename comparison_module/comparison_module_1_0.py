@@ -12,17 +12,18 @@ import argparse
 
 import sys
 
+import copy
+
 # modules of this project
 from reading_functions import read_var_file
 from reading_functions import merge_crop_test
+from reading_functions import get_sources
 
 from utility_functions import get_df_keys
 
 from interactive_ops import prep_out_dir
 from io_functions import prep_out_file
-
-from analysis_functions import analysis_1d
-from analysis_functions import analysis_nd
+from io_functions import read_job_file
 
 from interactive_ops import interactive_operation
 from interactive_ops import get_object
@@ -38,6 +39,24 @@ from alt_az_functions import calc_alt_az_lofar
 #    
 ###############################################################################
 
+def timestamp_arg(time_str):
+    """
+    This function checks that a command line argument is a valid timestamp 
+    and returns it as a pandas Timestamp.  The data are timed in UTC without 
+    a time zone, so timestamps with a time zone are converted to UTC and the
+    time zone is dropped.
+    """
+    try:
+        time_stamp = pd.Timestamp(time_str)
+    except ValueError:
+        time_stamp = pd.NaT
+    if pd.isnull(time_stamp):
+        raise argparse.ArgumentTypeError("invalid timestamp: '"+time_str+"'")
+    if time_stamp.tzinfo is not None:
+        time_stamp = time_stamp.tz_convert(None)
+    return (time_stamp)
+
+
 def beam_arg_parser():
     """
     This function parses the arguments from the command line and returns the 
@@ -81,6 +100,17 @@ sets the level of interactivity for the program inputs.
 2 indicates command line interactive mode
 3 indicates graphical interface interactive mode 
                              ''')   
+
+    # adds an optional argument for a batch job file
+    parser.add_argument("--batch", "-B", default=None,
+                             help='''
+path to a JSON (or YAML) job file listing sets of options to run in turn 
+against the same model and scope data.  Each set of options is applied on top
+of the command line options, without interaction.  Sets of options which only 
+differ in plotting options reuse the same merged data.  Jobs are run grouped by
+their merging options, in the order each group first appears in the file, so
+they may not run in file order.
+                             ''')   
     
     
 ###############################################################################
@@ -93,7 +123,8 @@ sets the level of interactivity for the program inputs.
     # gives positional and optional ways of providing the model data
     group_model.add_argument("model_p",nargs='?', default=None, 
                              help='''
-The file containing the data from the model (Usually DreamBeam)
+The file containing the data from the model (Usually DreamBeam).  May also be
+a folder or a quoted glob pattern of files to combine
                              ''')
     group_model.add_argument("--model", "-m",
                              help='''
@@ -110,12 +141,13 @@ Alternative way of specifying the file containing the data from the model
     # gives positional and optional ways of providing the scope data
     group_scope.add_argument("scope_p",nargs='?', default=None, 
                              help='''
-The file containing the observed data from the telescope
+The file containing the observed data from the telescope, or a folder of LOFAR
+ACC files.  May also be a folder or a quoted glob pattern of files to combine
                              ''')
     group_scope.add_argument("--scope", "-s",
                              help='''
 Alternative way of specifying the file containing the observed data from the 
-telescope
+telescope, or a folder of LOFAR ACC files
                              ''')
 
 ###############################################################################
@@ -129,6 +161,23 @@ path to a directory in which the output of the program is intended to be stored
 .  IF this argument is blank, output is to std.out and plots are to screen.
                              ''')   
 
+    # adds an optional argument for the cache directory
+    parser.add_argument("--cache_dir", default=None,
+                             help='''
+path to a directory in which parsed input files are cached.  If the same input
+file is used again, the cached data is loaded instead of parsing the file.  If
+this argument is blank, no cache is used.  Horizontal and station coordinates
+are also cached, so repeated runs for the same site, target and times skip
+the coordinate calculations.
+                             ''')   
+
+    # adds an optional argument for the maximum size of the cache
+    parser.add_argument("--cache_size", default=1000.0, type=float,
+                             help='''
+maximum size of the cache directory in MB.  When the cache grows beyond this
+size, the least recently used cache files are deleted.  Default is 1000 MB.
+                             ''')   
+
     # adds an optional argument for the title of graphs and out_files
     parser.add_argument("--title", "-t", default=[], nargs = '*',
                              help='''
@@ -143,7 +192,17 @@ files will have spaces replaced with underscores
                         help='''
 Sets the file type for image files to be saved as.  If using amimations, some
 file types will save animations, and others will save frames.  Default is png.
-                        ''')     
+                        ''')
+
+    # adds an optional argument for the number of processes used for reading,
+    # calculating and plotting
+    parser.add_argument("--jobs", "-j", default=1, type=int,
+                        help='''
+Number of threads used to read multiple input files, and of processes used to
+reduce folders of ACC files, to calculate figures of merit and to render plots
+when they are saved to OUT_DIR.  Plots are rendered without a display.  Plots
+shown on screen are always rendered one at a time.  Default is 1.
+                        ''')
                         
 ###############################################################################
 # Normalisation options
@@ -310,6 +369,49 @@ time of the scope data.  Default is no offset.  Offsets may only be given in
 whole seconds
                              ''')
 
+    # adds an optional argument for the tolerance when matching times
+    parser.add_argument("--time_tolerance", default = 0.0, type=float,
+                        help='''
+Sets the tolerance (in seconds) for matching the times of the scope and model.
+Each scope time is matched with the nearest model time within this tolerance.  
+Default is to only match identical times.
+                             ''')
+
+    # adds an optional argument for how to align the model with the scope
+    parser.add_argument("--align", default = "exact",
+                        choices=("exact", "nearest", "linear"),
+                        help='''
+Sets how the times of the model are aligned with the times of the scope before
+they are compared.  Default is exact.
+  exact = only compare times which match (within the time tolerance)
+  nearest = use the model values at the nearest model time to each scope time
+  linear = linearly interpolate the model values to each scope time
+                             ''')
+
+
+###############################################################################
+# Read window options
+###############################################################################
+    # adds an optional argument for a time window to read from the scope file
+    parser.add_argument("--time_window", default = None, nargs=2,
+                        type=timestamp_arg, metavar=("START", "END"),
+                        help='''
+Sets a window of time to read from a HDF5 scope file.  Must supply two 
+timestamps (e.g. 2018-03-16T11:30:00) for the start and end of the window.  
+START must not be later than END.  Times are in UTC; times with a time zone 
+(e.g. 2018-03-16T12:30:00+01:00) are converted to UTC.  Only the data between 
+these times is read from disk.  Default is to read all times in the file.
+                             ''')
+
+    # adds an optional argument for a subband window to read from the scope file
+    parser.add_argument("--subband_window", default = None, nargs=2, type=int,
+                        metavar=("FIRST", "LAST"),
+                        help='''
+Sets a window of subbands to read from a HDF5 scope file.  Must supply two 
+integers for the first and last subband index (inclusive) in the file.  FIRST
+must not be greater than LAST.  Only these subbands are read from disk.  
+Default is to read all subbands.
+                             ''')
                  
 ###############################################################################
 # Scale options
@@ -390,6 +492,26 @@ be 3 floats: Latitude, longitude (degrees) and height above sea level (metres).
 If two coordinates are specified, height will be assumed to be 0 (sea level)
                             ''')   
 
+    # adds an optional argument for the coordinate calculation
+    parser.add_argument("--coord_engine", default = "astropy",
+                        choices=("astropy", "fast"),
+                            help='''
+set the method used to calculate the Alt-Az coordinates of the target.  
+"astropy" uses the full astropy transformation.  "fast" uses a closed-form 
+sidereal time and hour angle calculation, which agrees with astropy to within 
+1 arcminute and is much faster for long observations.  Default is astropy
+                            ''')   
+
+    # adds an optional argument for interpolating the coordinates
+    parser.add_argument("--coord_interval", default = 0.0, type=float,
+                            help='''
+set an interval in minutes at which the Alt-Az coordinates of the target are
+calculated exactly.  The coordinates at other times are interpolated between
+these with a cubic spline, so long observations at fine cadence need few
+coordinate calculations.  If 0, coordinates are calculated for every time.
+Default is 0
+                            ''')   
+
 
 ###############################################################################
 # Image Size and resolution
@@ -435,10 +557,18 @@ Chooses the colorscheme for the plots, translated int US English.
     # passes these arguments to a unified variable
     args = parser.parse_args()
 
+    # checks that the read windows are not empty
+    if args.time_window is not None and args.time_window[0] > args.time_window[1]:
+        parser.error("--time_window START is later than END")
+    if (args.subband_window is not None and 
+        args.subband_window[0] > args.subband_window[1]):
+        parser.error("--subband_window FIRST is greater than LAST")
+
     # creates and uses a dictionary to store the mode arguments
     modes={}
     modes['verbose']=args.verbose    
     modes['interactive']=args.interactive    
+    modes['batch']=args.batch
     modes['norm']=args.norm
     modes['norm_data']=args.norm_data
     modes['crop_data']=args.crop_data
@@ -452,12 +582,21 @@ Chooses the colorscheme for the plots, translated int US English.
     modes['freq_file']=args.freq_file
     modes['three_d']=args.three_d
     modes['image_type']=args.image_type
+    modes['jobs']=max(args.jobs, 1)
     modes['frame_rate']=args.frame_rate
     modes['offset']=args.offset
+    modes['time_tolerance']=abs(args.time_tolerance)
+    modes['align']=args.align
+    modes['time_window']=args.time_window
+    modes['subband_window']=args.subband_window
+    modes['cache_dir']=args.cache_dir
+    modes['cache_size']=abs(args.cache_size)
     modes['location_name']=args.location_name
     modes['location_coords']=args.location_coords
     modes['object_name']=args.object_name
     modes['object_coords']=args.object_coords
+    modes['coord_engine']=args.coord_engine
+    modes['coord_interval']=abs(args.coord_interval)
     modes['scale']=args.scale
     modes['image_size']=args.image_size
     modes['dpi']=args.dpi
@@ -590,6 +729,11 @@ def analysis(merge_df, modes, m_keys, sources):
     based on options, chooses the analysis to perform and returns the 
     dataframes of the independent variables
     """
+    # the analysis functions are imported here, as they load matplotlib, 
+    # which is slow to import and not needed until the analysis is done
+    from analysis_functions import analysis_1d
+    from analysis_functions import analysis_nd
+    
     # runs different functions if there are one or multiple frequencies
     if merge_df.Freq.nunique()==1:
         # if only one frequency, does one-dimensional analysis
@@ -625,26 +769,72 @@ def output_df(merge_df, modes):
             print("ERROR: file output requested, but no directory selected.")
 
 
-def operational_loop(model_df, scope_df, modes):       
+# options which each cached stage of the operational loop depends on.  If the
+# values of these options are unchanged, the stage is not recomputed.
+# The merged dataframe depends on the options for merging, cropping, 
+# normalisation and differences
+MERGE_OPTIONS = ['offset', 'time_tolerance', 'align', 'crop', 'crop_type', 
+                 'crop_basis', 'crop_data', 'norm', 'norm_data', 'diff']
+# the coordinates depend on the target, location and coordinate options
+COORD_OPTIONS = ['object_coords', 'location_coords', 'location_name', 
+                 'coord_engine', 'coord_interval']
+
+def operational_loop(model_df, scope_df, modes, stage_cache=None):       
     """
     This function contains the main operational loop of the program.  This can
     be iterated many times as part of an interactive system.
+    
+    If a stage_cache dictionary is given, the merged dataframe and the 
+    filtered dataframe with coordinates are kept in it.  On later calls with 
+    the same stage_cache, each is only recomputed if the input data or the 
+    options it depends on have changed, so changing only plotting or output 
+    options does not repeat the merge or the coordinate calculations.
     """
-    # creates the dataframe to be used in plotting.  This dataframe may be
-    # cropped or normalised based on parameters from the user.
-    merge_df,sources=merge_crop_test(model_df, scope_df, modes)
-
-    # identifies the channels
-    m_keys=get_df_keys(merge_df, modes)
+    if stage_cache is None:
+        stage_cache = {}
     
-    # filters the frequencies if requested
-    merge_df = filter_frequencies(merge_df, modes)
+    # identifies the input data and the options that each stage depends on
+    merge_key = repr([id(model_df), id(scope_df)]+
+                     [modes[option] for option in MERGE_OPTIONS])
+    if modes['freq_file'] != "":
+        freq_key = modes['freq_file']
+    else:
+        freq_key = modes['freq']
+    coord_key = merge_key+repr([freq_key, "stn" in modes['plots']]+
+                               [modes[option] for option in COORD_OPTIONS])
+    
+    merge_df = get_cached_stage(stage_cache, 'coords', coord_key, modes)
+    if merge_df is None:
+        merge_df = get_cached_stage(stage_cache, 'merge', merge_key, modes)
+        if merge_df is None:
+            # creates the dataframe to be used in plotting.  This dataframe may 
+            # be cropped or normalised based on parameters from the user.
+            merge_df,sources=merge_crop_test(model_df, scope_df, modes)
+            # keeps the input data with the merged data, so that their ids
+            # are not reused while the merged data is cached
+            stage_cache['merge'] = (merge_key, merge_df, model_df, scope_df)
+    
+        # filters the frequencies if requested
+        # (a shallow copy is taken, so that columns added to it are not added
+        # to the cached merged dataframe)
+        merge_df = filter_frequencies(merge_df.copy(deep=False), modes)
+        
+        # performs the various operations to create the alt-az components
+        if len(merge_df)>0:
+            merge_df = alt_az_ops(merge_df, modes)
+        stage_cache['coords'] = (coord_key, merge_df)
+    
+    # identifies the sources and channels
+    sources = get_sources(model_df, scope_df, modes)
+    m_keys=get_df_keys(merge_df, modes)
 
     # if there is some data in the merged dataframe
     if len(merge_df)>0:
-        # performs the various operations to create the alt-az components
-        merge_df = alt_az_ops(merge_df, modes)
-
+        # the cached dataframe is shared with later runs, so the analysis and
+        # output are given a shallow copy, which columns may be added to 
+        # without changing it
+        merge_df = merge_df.copy(deep=False)
+        
         # chooses between various analysis options and then carries them out
         ind_dfs = analysis(merge_df, modes, m_keys, sources)
 
@@ -657,12 +847,132 @@ def operational_loop(model_df, scope_df, modes):
     else:
         if modes['verbose'] >=1:
             print("ERROR: NO DATA AVAILABLE TO ANALYSE!")
-        if modes['interactive']<2:
+        # in batch mode, the failure is reported and the other jobs are run
+        if modes['interactive']<2 and modes['batch'] is None:
             if modes['verbose'] >=1:
                 print("EXITING!")
             sys.exit(1)
 
 
+def get_cached_stage(stage_cache, stage, key, modes):
+    """
+    This function returns the dataframe cached for a stage of the operational
+    loop if it was calculated with the same key, or None otherwise
+    """
+    if stage in stage_cache and stage_cache[stage][0] == key:
+        if modes['verbose'] >=2:
+            print("Reusing "+stage+" data from the previous run")
+        return (stage_cache[stage][1])
+    return (None)
+
+
+
+
+###############################################################################
+#
+# batch operation functions
+#    
+###############################################################################
+
+# options which are used when reading the input files, so cannot be changed
+# by batch jobs
+READ_OPTIONS = ['in_file_model', 'in_file_scope', 'time_window', 
+                'subband_window', 'cache_dir', 'batch']
+
+def batch_operation(model_df, scope_df, modes):
+    """
+    This function runs each of the jobs in the batch job file against the 
+    model and scope data that has already been read.  
+    
+    The jobs are grouped by the options which change the merged dataframe, 
+    and run with a shared stage cache, so that the data is merged once for 
+    each group and reused for each job in it.  Only one merged dataframe is 
+    held at a time.  The groups are run in the order they first appear in the
+    job file, so jobs may run out of file order, but keep their numbers.
+    
+    A job with no data to analyse is reported and the remaining jobs are run.
+    If any jobs failed, the program exits with an error once all have run.
+    """
+    jobs = read_job_file(modes['batch'], modes)
+    
+    # groups the jobs by their merging options, in order of first appearance
+    merge_keys = []
+    job_groups = {}
+    for i in range(len(jobs)):
+        job_modes = set_job_modes(modes, jobs[i])
+        merge_key = repr([job_modes[option] for option in MERGE_OPTIONS])
+        if merge_key not in job_groups:
+            merge_keys.append(merge_key)
+            job_groups[merge_key] = []
+        job_groups[merge_key].append((i, job_modes))
+    
+    stage_cache = {}
+    failed_jobs = []
+    for merge_key in merge_keys:
+        for i, job_modes in job_groups[merge_key]:
+            if modes['verbose'] >=2:
+                print("Running batch job "+str(i+1)+" of "+str(len(jobs)))
+            operational_loop(model_df, scope_df, job_modes, stage_cache)
+            # the dataframe analysed by the job is the one cached after the
+            # coordinate stage, so a job with no data is one where it is empty
+            if len(stage_cache['coords'][1]) == 0:
+                if modes['verbose'] >=1:
+                    print("ERROR: batch job "+str(i+1)+" had no data to "+
+                          "analyse, continuing with the remaining jobs")
+                failed_jobs.append(i+1)
+    
+    # reports the failed jobs once all of the jobs have been run
+    if len(failed_jobs) > 0:
+        if modes['verbose'] >=1:
+            print("ERROR: "+str(len(failed_jobs))+" of "+str(len(jobs))+
+                  " batch jobs had no data to analyse: "+
+                  ", ".join([str(job) for job in failed_jobs]))
+            print("EXITING!")
+        sys.exit(1)
+
+
+def set_job_modes(modes, job):
+    """
+    This function returns a copy of modes with the options set by a batch job
+    applied.  The keys of the job are the names of the options, as used in 
+    modes.
+    """
+    job_modes = copy.deepcopy(modes)
+    # batch jobs are never interactive
+    job_modes['interactive'] = 0
+    
+    for option in job:
+        if option in READ_OPTIONS:
+            if modes['verbose'] >=1:
+                print("WARNING: "+option+" cannot be changed by a batch job")
+        elif option == 'title':
+            # titles may be given as a string or a list of words
+            if isinstance(job['title'], list):
+                title_words = [str(word) for word in job['title']]
+            else:
+                title_words = str(job['title']).split()
+            job_modes['title'] = " ".join(title_words)
+            job_modes['title_'] = "_".join(title_words)
+        elif option not in modes:
+            if modes['verbose'] >=1:
+                print("WARNING: unknown batch job option "+option+" ignored")
+        else:
+            job_modes[option] = job[option]
+    
+    # coordinates given directly replace coordinates set by name
+    if 'location_coords' in job and 'location_name' not in job:
+        job_modes['location_name'] = None
+    if 'object_coords' in job and 'object_name' not in job:
+        job_modes['object_name'] = None
+    
+    if 'out_dir' in job:
+        job_modes['out_dir'] = prep_out_dir(job['out_dir'], job_modes)
+    if 'location_name' in job or 'location_coords' in job:
+        job_modes = get_location(job_modes)
+    if 'object_name' in job or 'object_coords' in job:
+        job_modes = get_object(job_modes)
+    
+    return (job_modes)
 
 
 def main():
@@ -675,11 +985,16 @@ def main():
     # read in the file from the scope using variable reader
     scope_df = read_var_file(modes['in_file_scope'], modes)
 
-    if modes['interactive'] < 2:
+    if modes['batch'] is not None:
+        batch_operation(model_df, scope_df, modes)
+    elif modes['interactive'] < 2:
         operational_loop(model_df, scope_df, modes)
     else:
+        # keeps the intermediate data between iterations, so that only the 
+        # stages affected by changed options are recomputed
+        stage_cache = {}
         while modes['interactive'] >= 2:
-            operational_loop(model_df, scope_df, modes)
+            operational_loop(model_df, scope_df, modes, stage_cache)
             (modes, model_df, scope_df) = interactive_operation(modes, model_df, scope_df)
 
 
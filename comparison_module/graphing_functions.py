@@ -5,6 +5,8 @@ Created on Fri Jun 15 13:40:49 2018
 @author: User
 """
 
+import multiprocessing
+
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
@@ -14,6 +16,7 @@ from matplotlib.colors import SymLogNorm
 from matplotlib.colors import LogNorm
 
 import numpy as np
+import pandas as pd
 from scipy.stats.stats import pearsonr
 
 
@@ -26,6 +29,7 @@ from utility_functions import plottable
 from utility_functions import get_source_separator
 from utility_functions import get_alt_az_var
 from utility_functions import split_df
+from utility_functions import identify_plots
 
 from io_functions import prep_out_file
 
@@ -763,24 +767,6 @@ def four_var_plot(in_df,modes,var_x,var_y,var_z,var_y2,source, plot_name=""):
         plt.close()
 
 
-def identify_plots(modes):
-    sources = []
-
-
-    if "model" in modes["plots"]:
-        sources.append("model")
-    if "scope" in modes["plots"]:
-        sources.append("scope")
-    if "diff" in modes["plots"]:
-        sources.append("diff")
-
-    if len(sources) == 0:
-        if modes['verbose'] >=1:
-            print ("Warning: Sources not specified, no values will be plotted")
-
-    return (sources)
-
-
 def plot_spectra_nf(merge_df, m_keys, modes,sources):
     """
     This function takes a merged dataframe as an argument and plots a graph of
@@ -788,17 +774,31 @@ def plot_spectra_nf(merge_df, m_keys, modes,sources):
     frequency.
 
 
+    """
+    render_plots(spectra_plot_jobs(merge_df, m_keys, modes, sources), modes)
+
+    return(0)
+
+
+def spectra_plot_jobs(merge_df, m_keys, modes, sources):
+    """
+    Returns the list of plots made by plot_spectra_nf, as used by render_plots
     """
     time_delay = 1000.0/modes['frame_rate']
+    plot_jobs = []
 
     if modes['three_d'] in ["colour", "color", "contour"]:
         for source in sources:
+            sep = get_source_separator(source)
             for key in m_keys:
                 # creates a plot each of the values of model and scope
                 var_y="Freq"
                 var_x="d_Time"
 
-                plot_3d_graph(merge_df, key, modes, source, var_x, var_y)
+                plot_df = plot_columns(merge_df, [var_x, var_y, "Time",
+                                                  key+sep+source])
+                plot_jobs.append((plot_3d_graph, plot_df, key, modes, source,
+                                  var_x, var_y))
 
     elif modes['three_d'] in ["animf", "anim"]:
         if modes['three_d']=="anim":
@@ -808,12 +808,91 @@ def plot_spectra_nf(merge_df, m_keys, modes,sources):
             var_x = 'd_Time'
             t_var = 'Freq'
 
-        animated_plots(merge_df, modes, var_x, m_keys, t_var, sources, time_delay)
+        plot_jobs.extend(animated_plot_jobs(merge_df, modes, var_x, m_keys,
+                                            t_var, sources, time_delay))
 
     else:
         if modes['verbose'] >=1:
             print("WARNING: No valid value for 3d plots")
 
+    return(plot_jobs)
+
+
+def animated_plot_jobs(merge_df, modes, var_x, m_keys, t_var, sources, time_delay):
+    """
+    Returns the list of animations made by animated_plots, as used by 
+    render_plots
+    """
+    plot_jobs = []
+    if "overlay" in modes['plots']:
+        source_lists = [sources]
+    else:
+        source_lists = [[source] for source in sources]
+
+    for source_list in source_lists:
+        cols = [var_x, t_var, "Time", "Freq"]
+        for source in source_list:
+            sep = get_source_separator(source)
+            cols.extend([key+sep+source for key in m_keys])
+        plot_jobs.append((animated_plot, plot_columns(merge_df, cols), modes,
+                          var_x, m_keys, t_var, source_list, time_delay))
+    return(plot_jobs)
+
+
+def plot_columns(merge_df, cols):
+    """
+    Returns a dataframe with only the columns needed for a plot, so that only
+    those columns are sent to the worker processes
+    """
+    plot_cols = []
+    for col in cols:
+        if col in merge_df and col not in plot_cols:
+            plot_cols.append(col)
+    return(merge_df[plot_cols])
+
+
+def render_plots(plot_jobs, modes):
+    """
+    Renders a list of plots, each given as a tuple of a plotting function 
+    followed by its arguments.
+
+    If more than one job is requested and the plots are saved to out_dir, the
+    plots are rendered in a pool of worker processes using the Agg backend.  
+    Otherwise they are rendered one at a time.  The file names are set by 
+    prep_out_file in each plotting function, so they do not depend on the 
+    order the plots are rendered in.
+    """
+    n_jobs = min(modes['jobs'], len(plot_jobs))
+    if n_jobs <= 1 or modes['out_dir'] is None:
+        for plot_job in plot_jobs:
+            render_plot(plot_job)
+        return(0)
+
+    if modes['verbose'] >=2:
+        print("Rendering "+str(len(plot_jobs))+" plots in "+str(n_jobs)+
+              " processes")
+    pool = multiprocessing.Pool(n_jobs, initializer=init_plot_worker)
+    try:
+        # chunks of one plot keep the processes busy when plots differ in size
+        pool.map(render_plot, plot_jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return(0)
+
+
+def init_plot_worker():
+    """
+    Sets up a worker process to save plots without a display
+    """
+    plt.switch_backend('Agg')
+
+
+def render_plot(plot_job):
+    """
+    Calls the plotting function of a plot job with its arguments
+    """
+    plot_job[0](*plot_job[1:])
     return(0)
 
 
@@ -891,32 +970,70 @@ def calc_fom_nd(in_df, var_str, m_keys, modes,fom="rmse"):
     in current versions, useable values for fom are "rmse" and "corr"
     """
 
-    print("probe: ", modes['colour'])
     if modes['verbose'] >=2:
         print ("Calculating the "+gen_pretty_name(fom)+
                " between observed and model data.")
-    # creates empty lists for the Errors
-    n_foms = []
-    for i in range(len(m_keys)):
-        n_foms.append([])
 
-    # identifies allthe unique values of the variable in the column
-    unique_vals = in_df[var_str].unique()
+    fom_df = calc_fom_table(in_df, var_str, m_keys, fom)
+
+    plot_fom_nd(fom_df, var_str, m_keys, modes, fom)
+
+    # returns the figures of merit for each channel as lists
+    return ([list(fom_df[key+'_'+fom]) for key in m_keys])
+
+
+def calc_fom_table(in_df, var_str, m_keys, fom="rmse"):
+    """
+    Calculates the figure of merit for each channel at each unique value of
+    var_str.  All the channels are calculated together using a single groupby
+    rather than selecting the rows for each unique value in turn.
+
+    Returns a dataframe with the sorted unique values of var_str and a column
+    of the figure of merit for each channel
+    """
+    fom_cols = [key+'_'+fom for key in m_keys]
+    groups = in_df[var_str].values
+
+    if fom == "rmse":
+        diff_vals = fom_values(in_df, [key+'_diff' for key in m_keys], fom_cols)
+        fom_df = (diff_vals**2).groupby(groups).mean()**0.5
 
-    unique_vals = np.sort(unique_vals)
+    elif fom == "corr":
+        # the Pearson correlation coefficient of the values for each group, 
+        # calculated from the deviations from the group means
+        model_vals = fom_values(in_df, [key+'_model' for key in m_keys], fom_cols)
+        scope_vals = fom_values(in_df, [key+'_scope' for key in m_keys], fom_cols)
+        model_dev = model_vals-model_vals.groupby(groups).transform('mean')
+        scope_dev = scope_vals-scope_vals.groupby(groups).transform('mean')
 
-    # iterates over all unique values
-    for unique_val in unique_vals:
-        # creates a dataframe with  only the elements that match the current
-        # unique value 
-        unique_merge_df = in_df[in_df[var_str]==unique_val].copy().reset_index(drop=True)
-        # uses this unique value for and the 1-dimensional calc_fom_1d function
-        # to calculate the Figure of merit for each channel
-        n_fom = calc_fom_1d(unique_merge_df, m_keys, fom)
+        fom_df = ((model_dev*scope_dev).groupby(groups).sum()/
+                  ((model_dev**2).groupby(groups).sum()*
+                   (scope_dev**2).groupby(groups).sum())**0.5)
 
-        # appends these to the list
-        for i in range(len(m_keys)):
-            n_foms[i].append(n_fom[i])
+    fom_df.index.name = var_str
+    return (fom_df.reset_index())
+
+
+def fom_values(in_df, cols, fom_cols):
+    """
+    Returns a dataframe of the plottable (absolute for complex) values of cols
+    from in_df, with its columns named by fom_cols
+    """
+    data = {}
+    for i in range(len(cols)):
+        vals = in_df[cols[i]].values
+        if np.iscomplexobj(vals):
+            vals = np.abs(vals)
+        data[fom_cols[i]] = vals
+    return (pd.DataFrame(data=data, columns=fom_cols))
+
+
+def plot_fom_nd(fom_df, var_str, m_keys, modes, fom="rmse", plot_name=""):
+    """
+    Plots the figures of merit calculated by calc_fom_table for each channel 
+    against var_str.  plot_name identifies a part of a split dataframe.
+    """
+    unique_vals = fom_df[var_str].values
 
     # creates an overlaid plot of how the Figure of Merit  between model and scope
     # varies for each of the channels against var_str
@@ -958,7 +1075,7 @@ def calc_fom_nd(in_df, var_str, m_keys, modes,fom="rmse"):
             " in "])
     for key in m_keys:
         plt.plot(plottable(unique_vals, var_str),
-                 n_foms[m_keys.index(key)],
+                 fom_df[key+'_'+fom].values,
                  label=key+'_'+fom,
                  color=colour_models(key))
 
@@ -985,6 +1102,7 @@ def calc_fom_nd(in_df, var_str, m_keys, modes,fom="rmse"):
 
         plt_file = prep_out_file(modes,plot=fom,ind_var=var_str,
                                  channel=str_channel,
+                                 plot_name=plot_name,
                                  out_type=modes['image_type'])
 
         if modes['verbose'] >=2:
@@ -1001,8 +1119,7 @@ def calc_fom_nd(in_df, var_str, m_keys, modes,fom="rmse"):
                  print("Unable to show file.")
         plt.close()
 
-    # returns the correlation lists if needed
-    return (n_foms)
+    return(0)
 
 
 def calc_fom_1d(merge_df, m_keys, fom):
@@ -1038,6 +1155,16 @@ def plot_altaz_values_nf(merge_df, m_keys, modes, sources):
     """
     plots a series of altitude and azimuth based graphs
     """
+    render_plots(altaz_plot_jobs(merge_df, m_keys, modes, sources), modes)
+
+    return(0)
+
+
+def altaz_plot_jobs(merge_df, m_keys, modes, sources):
+    """
+    Returns the list of plots made by plot_altaz_values_nf, as used by 
+    render_plots
+    """
 #    directions = ['alt','az_ew']
 #    len_dir = len(directions)
     time_delay = 1000.0/modes['frame_rate']
@@ -1074,6 +1201,7 @@ def plot_altaz_values_nf(merge_df, m_keys, modes, sources):
 
 
     no_xplots = len (x_plots)
+    plot_jobs = []
 
     for i in range(no_xplots):
         counter = 0
@@ -1084,8 +1212,13 @@ def plot_altaz_values_nf(merge_df, m_keys, modes, sources):
 
                 for key in m_keys:
                     for j in range(1,len(x_plots[i])):
-                        four_var_plot(x_plots[i][j], modes, x_plots[i][0], "Freq", key,
-                                      y_plots[i], source, names[i][j])
+                        sep = get_source_separator(source)
+                        plot_df = plot_columns(x_plots[i][j],
+                                               [x_plots[i][0], "Freq", key,
+                                                y_plots[i], key+sep+source])
+                        plot_jobs.append((four_var_plot, plot_df, modes,
+                                          x_plots[i][0], "Freq", key,
+                                          y_plots[i], source, names[i][j]))
                         counter = counter +1
 
 
@@ -1107,7 +1240,9 @@ def plot_altaz_values_nf(merge_df, m_keys, modes, sources):
                 t_var = 'Freq'
 
             for j in range(1,len(x_plots[i])):
-                animated_plots(x_plots[i][j], modes, var_x, m_keys, t_var, sources, time_delay)
+                plot_jobs.extend(animated_plot_jobs(x_plots[i][j], modes, var_x,
+                                                    m_keys, t_var, sources,
+                                                    time_delay))
 #            elif modes['three_d']=="anim":
 #
 ##                if "alt" in modes['plots']:
@@ -1126,3 +1261,5 @@ def plot_altaz_values_nf(merge_df, m_keys, modes, sources):
 ##                if "az" in modes['plots']:
 #                    animated_plot(merge_df, modes, az_var, m_keys, "Freq", source,
 #                                  time_delay, plot_name = az_var)
+
+    return(plot_jobs)
@@ -14,9 +14,21 @@ from appearance_functions import gen_pretty_name
 
 import os.path
 
-import Tkinter as tk
-import tkFileDialog
-import tkFont
+# Tkinter is only imported when a graphical menu is first shown (see 
+# import_tk), so that non-interactive runs do not load it
+tk = None
+tkFileDialog = None
+tkFont = None
+
+
+def import_tk():
+    '''
+    imports the Tkinter modules used by the graphical menus
+    '''
+    global tk, tkFileDialog, tkFont
+    import Tkinter as tk
+    import tkFileDialog
+    import tkFont
 
 def cli_menu(menu_title="", menu_list=[], menu_status="", menu_prompt="",
              exit_prompt="", status_prompt="", desc_text="", warning=""):
@@ -273,6 +285,7 @@ def gui_menu(menu_title="", menu_list=[], menu_status="", menu_prompt="",
     #TODO: Temp label
     
     # Creates an interactive window
+    import_tk()
     root = tk.Tk()
     
     # sets up a variable that will eventually set the output
@@ -417,6 +430,7 @@ def gui_entry(menu_title="", menu_status="", menu_prompt="", desc_text="",
     out_var = ""
     
     # Creates an interactive window
+    import_tk()
     root = tk.Tk()
     
     # sets up a variable that will eventually set the output
@@ -584,6 +598,7 @@ def gui_coords(menu_title="", menu_status=[], menu_prompt="", desc_text="",
 
 
     # Creates an interactive window
+    import_tk()
     root = tk.Tk()
 
     button_var = tk.StringVar()
@@ -708,6 +723,7 @@ def close_and_value(root,var,value):
 
 def pick_in_file(root,var,menu_prompt,type_name):# ,file_options=("all files","*.*")):
     root.destroy()
+    import_tk()
     root = tk.Tk()
     if type_name == "File":
         root.filename = tkFileDialog.askopenfilename(initialdir = os.getcwd(),
@@ -2228,6 +2244,7 @@ def gui_set_values(modes, dict_set, each_status, warning = ""):
     menu_choice = ''
         
     # Creates an interactive window
+    import_tk()
     root = tk.Tk()
     
     # sets up a variable that will eventually set the output
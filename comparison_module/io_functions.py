@@ -5,6 +5,8 @@ Created on Fri Jun 15 13:43:38 2018
 @author: User
 """
 import os
+import sys
+import json
 
 
     
@@ -50,3 +52,68 @@ def prep_out_file(modes,source="",ind_var="",plot="",dims="",channel="",
     return (out_file_path)
 
 
+def is_job_list(job_list):
+    '''
+    Returns True if job_list is a list of dictionaries, as batch jobs are
+    '''
+    return (isinstance(job_list, list) and
+            all(isinstance(job, dict) for job in job_list))
+
+
+def read_job_file(file_name, modes):
+    '''
+    Reads a batch job file and returns a list of dictionaries of options, one
+    for each job.  
+    
+    The file is read as YAML if its name ends in .yaml or .yml, and as JSON 
+    otherwise.  It may contain either a list of jobs, or a dictionary with a 
+    list of "jobs" and a dictionary of "defaults" which are applied to every 
+    job.
+    '''
+    # errors raised by the parser for a badly formed file
+    parse_errors = (ValueError,)
+    try:
+        with open(file_name) as job_file:
+            if os.path.splitext(file_name)[1].lower() in ['.yaml', '.yml']:
+                try:
+                    import yaml
+                except ImportError:
+                    print("ERROR: unable to import yaml to read job file:\n\t"+
+                          file_name)
+                    sys.exit(1)
+                parse_errors = (ValueError, yaml.YAMLError)
+                job_data = yaml.safe_load(job_file)
+            else:
+                job_data = json.load(job_file)
+    except IOError as error:
+        print("ERROR: unable to read job file:\n\t"+file_name+"\n\t"+
+              str(error))
+        sys.exit(1)
+    except parse_errors as error:
+        print("ERROR: unable to parse job file:\n\t"+file_name+"\n\t"+
+              str(error))
+        sys.exit(1)
+    
+    if isinstance(job_data, dict):
+        defaults = job_data.get('defaults', {})
+        job_list = job_data.get('jobs', [])
+        if not isinstance(defaults, dict) or not is_job_list(job_list):
+            print("ERROR: the jobs in job file "+file_name+" must be a list "+
+                  "of dictionaries of options, and the defaults a dictionary")
+            sys.exit(1)
+        jobs = []
+        for job in job_list:
+            job_options = dict(defaults)
+            job_options.update(job)
+            jobs.append(job_options)
+    elif is_job_list(job_data):
+        jobs = job_data
+    else:
+        print("ERROR: job file "+file_name+" must contain a list of "+
+              "dictionaries of options, or a dictionary with such a list "+
+              "as \"jobs\"")
+        sys.exit(1)
+    
+    if modes['verbose'] >=2:
+        print("Read "+str(len(jobs))+" jobs from "+file_name)
+    return (jobs)
@@ -12,10 +12,163 @@ import numpy as np
 from utility_functions import plottable
 from utility_functions import get_source_separator
 
-from graphing_functions import identify_plots
+from utility_functions import identify_plots
+
+from cache_functions import get_cache_file
+from cache_functions import read_cache
+from cache_functions import write_cache
+
+from acc_functions import ACC_RCU_COUNT
+from acc_functions import map_acc_file
+from acc_functions import is_acc_folder
+from acc_functions import get_acc_files
+from acc_functions import get_rcu_mode
+from acc_functions import get_acc_freqs
+from acc_functions import calc_acc_beam
+from acc_functions import get_acc_times
 
 import sys
+import io
+import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import glob
+
+#Jones matrix elements in a DreamBeam csv file
+JONES_COLS = ['J11', 'J12', 'J21', 'J22']
+
+#file types of time and frequency data which read_var_file reads from folders
+READABLE_SUFFIXES = ['csv', 'hdf5']
+
+
+def read_jones_csv_converters(in_file):
+    '''
+    This function reads in a DreamBeam csv file using a complex converter for
+    each of the Jones matrix elements.  This is slow for large files, but 
+    accepts any value which python's complex() does.
+    '''
+    out_df=pd.read_csv(in_file,\
+                        converters={'J11':complex,'J12':complex,\
+                                    'J21':complex,'J22':complex}, \
+                        parse_dates=['Time'], skipinitialspace=True)   
+    return out_df
 
+def split_complex_bytes(raw, sep=b','):
+    '''
+    This function splits the python complex numbers, (X.xxxx+Y.yyyyj), in the 
+    raw bytes of a text file into their real and imaginary parts.
+    
+    The bytes are scanned with NumPy to find the sign of the imaginary part of
+    each number, which is stored and replaced with sep.  The brackets and the 
+    j are removed, so that the real parts and the magnitudes of the imaginary 
+    parts can be read as floats by the C parser of pandas.
+    
+    Returns the new bytes and a boolean array which is True for each number 
+    with a negative imaginary part, in the order of the numbers in the file.
+    A ValueError is raised if the bytes do not have this layout.
+    '''
+    body = np.frombuffer(raw, dtype=np.uint8)
+    
+    #every complex number ends in "j)"
+    j_pos = np.flatnonzero(body == ord('j'))
+    if len(j_pos) == 0 or j_pos[-1]+1 >= len(body) or \
+            np.any(body[j_pos+1] != ord(')')):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    
+    #finds the + and - signs which are not part of an exponent.  The sign of 
+    #the imaginary part is the last of these before each j
+    sign_pos = np.flatnonzero((body == ord('+')) | (body == ord('-')))
+    sign_pos = sign_pos[sign_pos > 0]
+    prev_char = body[sign_pos-1]
+    sign_pos = sign_pos[(prev_char != ord('e')) & (prev_char != ord('E'))]
+    sign_index = np.searchsorted(sign_pos, j_pos)-1
+    if np.any(sign_index < 0):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    imag_pos = sign_pos[sign_index]
+    imag_sign = body[imag_pos]
+    imag_neg = imag_sign == ord('-')
+    
+    #removes the brackets and j.  This moves each sign back by three places 
+    #for every preceding complex number and one place for its own bracket
+    data = bytearray(raw.translate(None, b'()j'))
+    if len(raw)-len(data) != 3*len(j_pos):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    imag_pos = imag_pos-3*np.arange(len(imag_pos))-1
+    data_arr = np.frombuffer(data, dtype=np.uint8)
+    if np.any(data_arr[imag_pos] != imag_sign):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    #splits the real and imaginary parts
+    data_arr[imag_pos] = ord(sep)
+    del body, data_arr
+    
+    return(data, imag_neg)
+
+def join_complex(real_vals, imag_vals, imag_neg):
+    '''
+    This function recombines the real parts and the magnitudes of the 
+    imaginary parts split by split_complex_bytes into a complex array.  The 
+    parts are set directly, rather than added, so that negative zeros keep 
+    their sign as they do in complex()
+    '''
+    out_vals = np.empty(len(real_vals), dtype=complex)
+    out_vals.real = real_vals
+    out_vals.imag = np.where(imag_neg, -imag_vals, imag_vals)
+    return(out_vals)
+
+def read_jones_csv(in_file):
+    '''
+    This function reads in a DreamBeam csv file without calling complex() on 
+    each of the Jones matrix elements.
+    
+    The Jones elements are written as python complex numbers, (X.xxxx+Y.yyyyj).
+    The raw bytes of the file are scanned with NumPy to find the sign of the 
+    imaginary part of each element, which is stored and replaced with a comma.
+    The brackets and the j are removed, so that the C parser of pandas reads 
+    the real parts and the magnitudes of the imaginary parts as float columns.
+    These are then recombined as complex columns.
+    
+    A ValueError is raised if the file does not have this layout.
+    '''
+    with open(in_file, 'rb') as f:
+        header = f.readline()
+        raw = f.read()
+    
+    col_names = [col.strip() for col in header.decode().split(',')]
+    jones_cols = [col for col in col_names if col in JONES_COLS]
+    if len(jones_cols) != len(JONES_COLS) or 'Time' not in col_names:
+        raise ValueError("Jones columns not found in "+in_file)
+        
+    data, imag_neg = split_complex_bytes(raw)
+    del raw
+    
+    part_names = []
+    part_types = {}
+    for col in col_names:
+        if col in jones_cols:
+            part_names.extend([col+'_re', col+'_im'])
+            part_types[col+'_re'] = float
+            part_types[col+'_im'] = float
+        else:
+            part_names.append(col)
+    
+    #the parts are parsed exactly, so that they match the values from complex()
+    parts_df = pd.read_csv(io.BytesIO(data), names=part_names, header=None,
+                           dtype=part_types, parse_dates=['Time'], 
+                           skipinitialspace=True, float_precision='round_trip')
+    
+    #checks that each row has exactly one value for each Jones element
+    if len(imag_neg) != len(parts_df)*len(jones_cols):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    imag_neg = imag_neg.reshape(len(parts_df), len(jones_cols))
+    
+    #recombines the real and imaginary parts as complex columns
+    for i in range(len(jones_cols)):
+        col = jones_cols[i]
+        real_vals = parts_df[col+'_re'].values
+        imag_vals = parts_df[col+'_im'].values
+        parts_df[col] = join_complex(real_vals, imag_vals, imag_neg[:,i])
+    
+    return parts_df[col_names]
 
 def read_dreambeam_csv(in_file,modes):
     '''
@@ -27,10 +180,14 @@ def read_dreambeam_csv(in_file,modes):
     '''
     if modes['verbose'] >=2:
         print("Reading in CSV file: "+in_file)
-    out_df=pd.read_csv(in_file,\
-                        converters={'J11':complex,'J12':complex,\
-                                    'J21':complex,'J22':complex}, \
-                        parse_dates=['Time'], skipinitialspace=True)   
+    try:
+        #parses the Jones matrix elements in bulk
+        out_df=read_jones_csv(in_file)
+    except ValueError:
+        #falls back to converting the elements one at a time
+        if modes['verbose'] >=2:
+            print("Bulk parsing failed, converting Jones elements individually")
+        out_df=read_jones_csv_converters(in_file)
     
     
     '''
@@ -49,7 +206,7 @@ def read_dreambeam_csv(in_file,modes):
     # 2. yx not included in scope data (presumably because of 1.)
     #merge_df['yx_model']=merge_df.J21*np.conj(merge_df.J11)+merge_df.J22*np.conj(merge_df.J12)
     '''
-    out_df=calc_xy(out_df)
+    out_df=calc_xy(out_df, inplace=True)
     
     if 'd_Time' not in out_df:
         #creates a variable to hold the time since the start of the plot
@@ -59,6 +216,116 @@ def read_dreambeam_csv(in_file,modes):
         
     return out_df
 
+def read_jones_out_lines(in_file):
+    '''
+    This function reads in a DreamBeam all-sky .out file one line at a time, 
+    calling complex() on each of the Jones matrix elements.  This is slow for 
+    large files, but accepts any value which python's complex() does.
+    '''
+    with open(in_file, 'r') as f:
+        in_lines = f.read().replace('\r', '').rstrip('\n').split('\n')
+    
+    out_list = []
+    for line_index in range(1, len(in_lines), 2):
+        alt_az_strs = in_lines[line_index-1].split(" ")[2:4]
+        jones_strs = in_lines[line_index].split(" ")[1:5]
+        out_list.append([float(alt_az) for alt_az in alt_az_strs]+
+                        [complex(jones) for jones in jones_strs])
+    
+    #builds each column with its own type, as pandas loses the sign of a 
+    #negative zero real part when it infers complex columns from objects
+    out_cols = list(zip(*out_list))
+    if len(out_cols) == 0:
+        out_cols = [[]]*(2+len(JONES_COLS))
+    out_df = pd.DataFrame({'az':np.degrees(np.array(out_cols[0], dtype=float)),
+                           'alt':np.degrees(np.array(out_cols[1], dtype=float))},
+                          columns=['az', 'alt'])
+    for i in range(len(JONES_COLS)):
+        out_df[JONES_COLS[i]] = np.array(out_cols[2+i], dtype=complex)
+    return(out_df)
+
+def read_jones_out(in_file):
+    '''
+    This function reads in a DreamBeam all-sky .out file without splitting 
+    each line or calling complex() on each of the Jones matrix elements.
+    
+    The lines of the file alternate between a pointing line, whose third and
+    fourth values are the azimuth and altitude in radians, and a Jones line,
+    whose second to fifth values are J11, J12, J21 and J22 as python complex
+    numbers.  The two streams of lines are separated and each is parsed in
+    bulk by pandas, with the Jones elements split by split_complex_bytes.
+    
+    A ValueError is raised if the file does not have this layout.
+    '''
+    with open(in_file, 'rb') as f:
+        in_lines = f.read().replace(b'\r', b'').rstrip(b'\n').split(b'\n')
+
+    #each pointing line is followed by its Jones line, an unpaired last line
+    #is skipped
+    n_pairs = len(in_lines)//2
+    alt_az_raw = b'\n'.join(in_lines[0:2*n_pairs:2])
+    jones_raw = b'\n'.join(in_lines[1:2*n_pairs:2])
+    del in_lines
+
+    #the pointings and Jones elements are parsed exactly, so that they match
+    #the values from float() and complex()
+    alt_az_df = pd.read_csv(io.BytesIO(alt_az_raw), sep=' ', header=None,
+                            usecols=[2, 3], dtype=float,
+                            float_precision='round_trip')
+    alt_az_df.columns = ['az', 'alt']
+    del alt_az_raw
+
+    #the real and imaginary parts of each Jones element are read as two values
+    data, imag_neg = split_complex_bytes(jones_raw, sep=b' ')
+    del jones_raw
+    part_names = []
+    for col in JONES_COLS:
+        part_names.extend([col+'_re', col+'_im'])
+    parts_df = pd.read_csv(io.BytesIO(data), sep=' ', header=None,
+                           usecols=range(1, 1+len(part_names)), dtype=float,
+                           float_precision='round_trip')
+    parts_df.columns = part_names
+    del data
+
+    #checks that each line has exactly one value for each Jones element
+    if len(alt_az_df) != n_pairs or len(parts_df) != n_pairs or \
+            len(imag_neg) != n_pairs*len(JONES_COLS):
+        raise ValueError("Jones elements not formatted as complex numbers")
+    imag_neg = imag_neg.reshape(n_pairs, len(JONES_COLS))
+
+    out_df = pd.DataFrame({'az':np.degrees(alt_az_df['az'].values),
+                           'alt':np.degrees(alt_az_df['alt'].values)},
+                          columns=['az', 'alt'])
+    #recombines the real and imaginary parts as complex columns
+    for i in range(len(JONES_COLS)):
+        col = JONES_COLS[i]
+        real_vals = parts_df[col+'_re'].values
+        imag_vals = parts_df[col+'_im'].values
+        out_df[col] = join_complex(real_vals, imag_vals, imag_neg[:,i])
+
+    return(out_df)
+
+def read_all_sky_jones(in_file, modes):
+    '''
+    This function reads in an all-sky .out file output by DreamBeam into a
+    dataframe of the Jones matrix and the xx, xy and yy values at each azimuth
+    and altitude.  The azimuth and altitude are in degrees
+    '''
+    if modes['verbose'] >=2:
+        print("Reading in all-sky Jones file: "+in_file)
+    try:
+        #parses the Jones matrix elements in bulk
+        out_df=read_jones_out(in_file)
+    except ValueError:
+        #falls back to converting the elements one line at a time
+        if modes['verbose'] >=2:
+            print("Bulk parsing failed, converting Jones elements individually")
+        out_df=read_jones_out_lines(in_file)
+    
+    out_df=calc_xy(out_df, inplace=True)
+    
+    return(out_df)
+
 def read_OSO_h5 (file_name, modes):
     '''
     This function reads in the data from an OSO-supplied HDF5 file and converts
@@ -67,8 +334,12 @@ def read_OSO_h5 (file_name, modes):
     Inputs: file name containing the path to a HDF5 file
     Outputs: Data Frame containing time, frequency, xx, xy and yy values
     
-    This function uses slightly crude methods, and probably needs to be 
-    updated with a more straightforward conversion from HDF5 to a dataframe
+    The datasets are read as NumPy arrays and the long-format frame is built
+    by repeating the times over the frequencies and tiling the frequencies
+    over the times, so that row order is time-major as in the HDF5 file.
+    
+    If a time or subband window is set in modes, only that hyperslab of the 
+    XX, XY and YY datasets is read from disk.
     '''
     if modes['verbose'] >=2:
         print("Reading in HDF5 file: "+file_name)
@@ -76,82 +347,340 @@ def read_OSO_h5 (file_name, modes):
     #Reads in the designated HDF5 file
     f = h5py.File(file_name, 'r')
     
-    #Creates lists to hold the contents of the various HDF5 datasets within the
-    #file.  These are then merged to form the data frame.
-    time_list=[]
-    d_time=[]
-    freq_list=[]
-    xx_list=[]
-    xy_list=[]
-    yy_list=[]
-
-    #creates an index for the time stamps
-    time_index=0
-    
-    #creates lists from the file
-    f_start_list = list(f["timeaccstart"])
-    f_freq_list = list(f['frequency'])
-    f_xx=list(f['XX'])
-    f_xy=list(f['XY'])
-    f_yy=list(f['YY'])
-
-    #identifies the start time.  Times in HDF5 are stored as floats since the
-    #epoch of Jan 01 00:00:00 1970
-    min_time=pd.to_datetime(min(f_start_list),unit='s')
-    
-    #this shouldn't be needed in the final product, included durind calibration
-    #mismatch issues
-    #min_freq=min(list(f['frequency']))
-    
-    #Iterates over the time values in the HDF5 file
-    for time_val in f_start_list:
-        #(re-)initialises the index for frequencies in the HDF5 file
-        freq_index=0
-        #Iterates over the frequency values in the HDF5 file
-        for freq_val in f_freq_list:
-            time_stamp_val=pd.to_datetime(time_val,unit='s')
-            #appends the values from the iterators for Time and Frequency
-            time_list.append(time_stamp_val)
-            d_time.append((time_stamp_val-min_time)/np.timedelta64(1,'s')) #useful for calculations
-
-
-            '''
-            #Code removed after corrections to lightcurve generation software
-            
-            #leave this here for possible tests in case there are issues later
-           
-            freq_list.append(min_freq+(freq_index*(1e8/512.0)))
-            
-            
-            ##This is the correct code to process from the file
-            #
-            '''            
-            freq_list.append(freq_val)
-            
-            #uses the indices to find the correct values for XX, XY and YY
-            xx_list.append(f_xx[time_index][freq_index])
-            xy_list.append(f_xy[time_index][freq_index])
-            yy_list.append(f_yy[time_index][freq_index])
-            
-            #increments the indices
-            freq_index = freq_index+1
-        time_index=time_index+1
+    #reads the datasets from the file as arrays.  Times in HDF5 are stored as 
+    #floats since the epoch of Jan 01 00:00:00 1970
+    f_start = np.asarray(f["timeaccstart"][()], dtype=float)
+    f_freq = np.asarray(f['frequency'][()])
     
-    #creates the data frame by pasting the lists together    
-    out_df=pd.DataFrame(data={'Time':time_list, 'd_Time':d_time, 
-                                'Freq':freq_list,
-                                'xx':xx_list,'xy':xy_list,'yy':yy_list})
-
-
+    #identifies the slabs of the file to read
+    time_slice, freq_slice = get_h5_window(f_start, f_freq, modes)
+    f_start = f_start[time_slice]
+    f_freq = f_freq[freq_slice]
+    
+    #hyperslab selection so that only the requested window is read from disk
+    f_xx = np.asarray(f['XX'][time_slice, freq_slice])
+    f_xy = np.asarray(f['XY'][time_slice, freq_slice])
+    f_yy = np.asarray(f['YY'][time_slice, freq_slice])
+    f.close()
+    
+    n_times = len(f_start)
+    n_freqs = len(f_freq)
+    
+    #only the values with a time and a frequency are kept, in case the 
+    #datasets are larger than the time and frequency axes
+    for f_data in [f_xx, f_xy, f_yy]:
+        if f_data.ndim != 2 or f_data.shape[0] < n_times or \
+                f_data.shape[1] < n_freqs:
+            raise IOError("XX, XY and YY datasets smaller than the times and "+
+                          "frequencies in "+file_name)
+    f_xx = f_xx[:n_times,:n_freqs]
+    f_xy = f_xy[:n_times,:n_freqs]
+    f_yy = f_yy[:n_times,:n_freqs]
+    
+    #each time is repeated once per frequency and the frequencies are tiled 
+    #once per time, matching the (time, frequency) layout of XX, XY and YY
+    time_vals = pd.to_datetime(np.repeat(f_start, n_freqs), unit='s')
+    freq_vals = np.tile(f_freq, n_times)
+    
+    #identifies the start time and calculates the time since the start
+    if n_times > 0:
+        min_time = pd.to_datetime(f_start.min(), unit='s')
+    else:
+        if modes['verbose'] >=1:
+            print("Warning: no times in "+file_name+" within the read window")
+        min_time = pd.to_datetime(0, unit='s')
+    d_time = (time_vals-min_time)/np.timedelta64(1,'s') #useful for calculations
+    
+    #creates the data frame by flattening the 2-d datasets in row-major order
+    out_df=pd.DataFrame(data={'Time':time_vals, 'd_Time':np.asarray(d_time), 
+                                'Freq':freq_vals,
+                                'xx':f_xx.ravel(),
+                                'xy':f_xy.ravel(),
+                                'yy':f_yy.ravel()})
         
     #returns the data frame
     return(out_df)
 
+def get_h5_window(f_start, f_freq, modes):
+    '''
+    This function converts the time and subband windows in modes into slices
+    of the time and frequency axes of an OSO HDF5 file.
+    
+    The time window is a pair of timestamps (inclusive) and the subband window
+    is a pair of subband indices (inclusive).  Either may be None, in which 
+    case the whole axis is selected.  Times in the file are assumed to be 
+    sorted, so the window is always a contiguous slab.
+    '''
+    time_slice = slice(None)
+    freq_slice = slice(None)
+    
+    if modes['time_window'] is not None:
+        #converts the window limits to seconds since the epoch, as in the file
+        epoch = pd.Timestamp(0)
+        t_min = (pd.Timestamp(modes['time_window'][0])-epoch)/np.timedelta64(1,'s')
+        t_max = (pd.Timestamp(modes['time_window'][1])-epoch)/np.timedelta64(1,'s')
+        if modes['verbose'] >=2:
+            print("Reading times from "+str(modes['time_window'][0])+
+                  " to "+str(modes['time_window'][1]))
+        time_slice = slice(np.searchsorted(f_start, t_min, side='left'),
+                           np.searchsorted(f_start, t_max, side='right'))
+        
+    if modes['subband_window'] is not None:
+        if modes['verbose'] >=2:
+            print("Reading subbands "+str(modes['subband_window'][0])+
+                  " to "+str(modes['subband_window'][1]))
+        sb_min = max(int(modes['subband_window'][0]), 0)
+        sb_max = min(int(modes['subband_window'][1]), len(f_freq)-1)
+        freq_slice = slice(sb_min, sb_max+1)
+        
+    return (time_slice, freq_slice)
+
+def read_acc_cube(file_name, modes, rcu_count=ACC_RCU_COUNT):
+    '''
+    This function opens an array covariance cube (ACC) of shape
+    (subbands, rcu, rcu) without reading it into memory.
+
+    Raw ACC .dat files and NPY files from ACC_CSV_Converter are
+    memory-mapped, and HDF5 files from ACC_CSV_Converter are returned as their
+    "acc" dataset, which reads subbands from disk as they are indexed.  The
+    HDF5 file stays open until the dataset is no longer used.
+
+    Returns None if the file cannot be opened as an ACC cube
+    '''
+    if modes['verbose'] >=2:
+        print("Opening ACC cube: "+file_name)
+
+    suffix = file_name.rsplit('.',1)[-1].lower()
+    try:
+        if 'npy' == suffix:
+            acc_cube = np.load(file_name, mmap_mode='r')
+        elif suffix in ['hdf5', 'h5']:
+            acc_cube = h5py.File(file_name, 'r')['acc']
+        elif 'dat' == suffix:
+            # raw ACC files have no header, so the number of subbands is
+            # calculated from the file size
+            acc_cube = map_acc_file(file_name, rcu_count)
+        else:
+            raise ValueError("unknown ACC file type")
+    except (IOError, OSError, KeyError, ValueError):
+        print("Error: file "+file_name+" unable to load as an ACC cube")
+        return (None)
+
+    if len(acc_cube.shape) != 3 or acc_cube.shape[0] == 0 or \
+            acc_cube.shape[1] != acc_cube.shape[2]:
+        print("Error: "+file_name+" does not contain an ACC cube")
+        return (None)
+
+    return (acc_cube)
+
+def read_acc_folder(acc_folder, modes):
+    '''
+    This function reads a folder of LOFAR ACC files and reduces each of them
+    to the power in the XX, XY and YY channels of the station beam, giving
+    the same data frame as read_OSO_h5 without converting the files to HDF5.
+
+    Each file is memory-mapped and reduced by calc_acc_beam.  If more than
+    one job is set in modes, the files are reduced in a pool of processes.
+    The start time of each file is taken from its name, and each subband is
+    sampled ACC_SUBBAND_INTERVAL seconds after the one before it.  The 
+    frequencies of the subbands are taken from the RCU mode in the name of 
+    the folder.
+
+    No beamforming weights are applied, so the power is that of the station 
+    beam at the zenith, rather than towards the object.
+
+    If a time or subband window is set in modes, only the files and subbands
+    in that window are reduced.
+    '''
+    if modes['verbose'] >=2:
+        print("Reading in ACC folder: "+acc_folder)
+    if modes['verbose'] >=1:
+        print("WARNING: no beamforming weights for the ACC files in "+
+              acc_folder+", using the station beam at the zenith")
+
+    acc_files = get_acc_files(acc_folder, modes)
+    if len(acc_files) == 0:
+        if modes['verbose'] >=1:
+            print("Warning: no ACC files in "+acc_folder+
+                  " within the read window")
+        return(pd.DataFrame(data={"none":[]}))
+
+    #the frequencies are the same for every file in the folder
+    subbands = acc_files[0][2][0]
+    f_freq = get_acc_freqs(get_rcu_mode(acc_folder, modes), subbands)
+
+    #identifies the subbands to reduce
+    sb_slice = slice(None)
+    if modes['subband_window'] is not None:
+        sb_min = max(int(modes['subband_window'][0]), 0)
+        sb_max = min(int(modes['subband_window'][1]), subbands-1)
+        sb_slice = slice(sb_min, sb_max+1)
+    f_freq = f_freq[sb_slice]
+    sb_numbers = np.arange(subbands)[sb_slice]
+
+    acc_jobs = [(file_name, shape, sb_slice, modes)
+                for file_name, acc_time, shape in acc_files]
+    n_jobs = min(modes['jobs'], len(acc_jobs))
+    if n_jobs <= 1:
+        acc_powers = [reduce_acc_file(acc_job) for acc_job in acc_jobs]
+    else:
+        if modes['verbose'] >=2:
+            print("Reducing "+str(len(acc_jobs))+" ACC files in "+
+                  str(n_jobs)+" processes")
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            acc_powers = pool.map(reduce_acc_file, acc_jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    #keeps only the files which could be read
+    f_start = [acc_files[i][1] for i in range(len(acc_files))
+               if acc_powers[i] is not None]
+    acc_powers = [acc_power for acc_power in acc_powers
+                  if acc_power is not None]
+    if len(acc_powers) == 0:
+        return(pd.DataFrame(data={"none":[]}))
+
+    n_times = len(f_start)
+
+    #each subband of each file has its own time, and the frequencies are 
+    #tiled once per file, in the same order as read_OSO_h5
+    time_vals = pd.to_datetime(get_acc_times(f_start, sb_numbers).ravel())
+    freq_vals = np.tile(f_freq, n_times)
+    xx_vals = np.concatenate([acc_power[0] for acc_power in acc_powers])
+    xy_vals = np.concatenate([acc_power[1] for acc_power in acc_powers])
+    yy_vals = np.concatenate([acc_power[2] for acc_power in acc_powers])
+
+    #drops the subbands of files at the edges of the window sampled outside it
+    if modes['time_window'] is not None:
+        in_window = ((time_vals >= pd.Timestamp(modes['time_window'][0])) &
+                     (time_vals <= pd.Timestamp(modes['time_window'][1])))
+        time_vals = time_vals[in_window]
+        freq_vals = freq_vals[in_window]
+        xx_vals = xx_vals[in_window]
+        xy_vals = xy_vals[in_window]
+        yy_vals = yy_vals[in_window]
+        if len(time_vals) == 0:
+            return(pd.DataFrame(data={"none":[]}))
+
+    d_time = (time_vals-min(time_vals))/np.timedelta64(1,'s')
+
+    out_df=pd.DataFrame(data={'Time':time_vals, 'd_Time':np.asarray(d_time),
+                              'Freq':freq_vals,
+                              'xx':xx_vals, 'xy':xy_vals, 'yy':yy_vals})
+
+    return(out_df)
+
+def reduce_acc_file(acc_job):
+    '''
+    Reduces one ACC file from read_acc_folder to the XX, XY and YY powers of
+    its subbands.  acc_job is a tuple of the file name, the shape of the cube
+    from the file name, the slice of subbands to reduce and modes.
+
+    Returns None if the file cannot be read
+    '''
+    file_name, shape, sb_slice, modes = acc_job
+    acc_cube = read_acc_cube(file_name, modes, rcu_count=shape[1])
+    if acc_cube is None:
+        return (None)
+    if acc_cube.shape[0] < shape[0]:
+        if modes['verbose'] >=1:
+            print("Warning: "+file_name+" is incomplete, skipping")
+        return (None)
+
+    #only the selected subbands are read from the memory-mapped file
+    return (calc_acc_beam(acc_cube[:shape[0]][sb_slice]))
+
+def get_file_names(file_name, modes):
+    '''
+    This function expands an input file name which is a glob pattern or a 
+    folder into a sorted list of file names.  A folder is expanded to the 
+    files in it which can be read, unless it is a folder of ACC files, which
+    is read as a whole.  Any other file name is returned in a list as it is.
+    '''
+    if file_name == '':
+        return ([file_name])
+    elif os.path.isdir(file_name):
+        if is_acc_folder(file_name):
+            return ([file_name])
+        file_names = [os.path.join(file_name, name)
+                      for name in sorted(os.listdir(file_name))
+                      if name.rsplit('.',1)[-1] in READABLE_SUFFIXES]
+    elif any(char in file_name for char in '*?['):
+        file_names = sorted(glob.glob(file_name))
+    else:
+        return ([file_name])
+
+    if modes['verbose'] >=2:
+        print(file_name+" contains "+str(len(file_names))+" files")
+    return (file_names)
+
+def read_var_files(file_names, modes, origin=""):
+    '''
+    This function reads several files using read_var_file, in a pool of 
+    threads if more than one job is set in modes, and concatenates them into
+    one data frame sorted by time and frequency.
+    
+    Where files overlap, only the first row for each time and frequency is
+    kept, taking the files in the order given.  d_Time is recalculated from 
+    the start of the first file.
+    '''
+    if len(file_names) == 0:
+        if modes['verbose'] >=1:
+            print("Warning: no files to read in "+origin)
+        return(pd.DataFrame(data={"none":[]}))
+
+    n_jobs = min(modes['jobs'], len(file_names))
+    if n_jobs <= 1:
+        in_dfs = [read_var_file(file_name, modes) for file_name in file_names]
+    else:
+        if modes['verbose'] >=2:
+            print("Reading "+str(len(file_names))+" files in "+str(n_jobs)+
+                  " threads")
+        # threads are used so the data frames are not copied between processes
+        pool = ThreadPool(n_jobs)
+        try:
+            in_dfs = pool.map(lambda file_name: read_var_file(file_name, modes),
+                              file_names)
+        finally:
+            pool.close()
+            pool.join()
+
+    in_dfs = [in_df for in_df in in_dfs if "none" not in in_df]
+    if len(in_dfs) == 0:
+        return(pd.DataFrame(data={"none":[]}))
+
+    out_df = pd.concat(in_dfs, ignore_index=True, sort=False)
+    del in_dfs
+
+    #removes the rows for times and frequencies already read from earlier files
+    duplicates = out_df.duplicated(subset=['Time','Freq'], keep='first')
+    if duplicates.any():
+        if modes['verbose'] >=1:
+            print("Warning: "+str(duplicates.sum())+" duplicated times and "+
+                  "frequencies in "+origin+", keeping the first")
+        out_df = out_df.loc[~duplicates]
+
+    #sorts the rows time-major, as in a single file
+    out_df = out_df.sort_values(['Time','Freq'], kind='mergesort')
+    out_df = out_df.reset_index(drop=True)
+    out_df['d_Time'] = (out_df.Time-min(out_df.Time))/np.timedelta64(1,'s')
+
+    return(out_df)
+
 def read_var_file(file_name,modes):
     '''
     This function reads in the filename and checks the suffix.  Depending on
     the suffix chosen, it calls different file reader functions
+    
+    If the file name is a glob pattern or a folder of files, each of the files
+    is read and they are combined by read_var_files
     '''
+    file_names = get_file_names(file_name, modes)
+    if file_names != [file_name]:
+        return(read_var_files(file_names, modes, file_name))
+
     if modes['verbose'] >=2:
         print("Determining file type for: "+file_name)
     
@@ -165,10 +694,19 @@ def read_var_file(file_name,modes):
     except IndexError:
         suffix=""
     
+    #checks for a cached copy of the file if caching is enabled
+    cache_file=get_cache_file(file_name, modes)
+    if cache_file is not None:
+        cache_df=read_cache(cache_file, modes)
+        if cache_df is not None:
+            return(cache_df)
+    
     #sets the blank dataframe 
     out_df=blank_df    
     if '' == file_name:
         pass # return the blank data frame
+    elif os.path.isdir(file_name):
+        out_df=read_acc_folder(file_name, modes)
     elif 'csv'==suffix:
         try:
             out_df=read_dreambeam_csv(file_name, modes)
@@ -190,29 +728,44 @@ def read_var_file(file_name,modes):
     else:
        
         #calculates the stokes parameters for the dataframe
-        out_df=calc_stokes(out_df,modes)
+        #the dataframe was created by the reader, so it can be modified in place
+        out_df=calc_stokes(out_df,modes,inplace=True)
+        
+        #stores the parsed dataframe for later runs
+        if cache_file is not None:
+            write_cache(out_df, cache_file, modes)
     
     return(out_df)
 
-def crop_and_norm(in_df,modes,origin):
+def crop_and_norm(in_df,modes,origin,copy=False):
     '''
     this funtion returns a data frame that has been normalised based on the 
     options in modes
+    
+    The input dataframe is never modified, as it is reused if the merge is 
+    repeated.  If copy is True, the returned dataframe is never the input 
+    dataframe, so that the caller can modify it in place.  Otherwise, the 
+    input dataframe is returned if it is neither cropped nor normalised.
     '''
     origin_options = ['b']
     origin_options.append(origin)
     
-    out_df=in_df.copy()
-    
+    #cropping already returns a new dataframe, so a copy is only made if the
+    #data is not cropped, and then only if it is to be modified
     if any (c in modes['crop_data'] for c in origin_options):
         #always crops zero values, may crop high values depending on user input
-        out_df = crop_vals(out_df,modes)
+        out_df = crop_vals(in_df,modes)
+    elif copy or any (c in modes['norm_data'] for c in origin_options):
+        out_df = in_df.copy()
+    else:
+        out_df = in_df
+    
     if any (c in modes['norm_data'] for c in origin_options):    
         for channel in ["xx","xy","yy"]:
             # normalises the dataframe
             out_df = normalise_data(out_df,modes,channel)
         # recalculates the Stokes Parameters for the normalised values
-        out_df = calc_stokes(out_df,modes)
+        out_df = calc_stokes(out_df,modes,inplace=True)
     return(out_df)
 
 def merge_crop_test(model_df, scope_df, modes):
@@ -243,16 +796,12 @@ def merge_crop_test(model_df, scope_df, modes):
         # merges the dataframes
         merge_df=merge_dfs(model_df, scope_df, modes)
         
-        # identifies the sources required
-        sources = identify_plots(modes)
-        
-    # if only scope is valid
+    # if only scope is valid.  The merged dataframe has columns added to it 
+    # in place by later stages, so it must not be the input dataframe
     elif "none" in model_df and "none" not in scope_df:
-        merge_df=crop_and_norm(scope_df,modes,"s")
-        sources = [""]  # sets the source to blank as there are no differentiators
+        merge_df=crop_and_norm(scope_df,modes,"s",copy=True)
     elif "none" not in model_df and "none" in scope_df:
-        merge_df=crop_and_norm(model_df,modes,"m")
-        sources = [""]
+        merge_df=crop_and_norm(model_df,modes,"m",copy=True)
     else: #Both blank
         if modes['verbose'] >=1:
             print("ERROR: No data available in either file")
@@ -260,9 +809,24 @@ def merge_crop_test(model_df, scope_df, modes):
             sys.exit(1)
         else:
             merge_df=pd.DataFrame(data={"none":[]})
-            sources=[""]
             #in high interactivity modes, will be able to create new data later
+    
+    # identifies the sources required
+    sources = get_sources(model_df, scope_df, modes)
     return(merge_df, sources)
+
+def get_sources(model_df, scope_df, modes):
+    """
+    This function returns the sources to be plotted.  If both dataframes have
+    contents, these are the sources identified from the plot options.  
+    Otherwise, it is a list containing the empty string, as values are 
+    plotted from the only dataframe with no suffix
+    """
+    if "none" not in model_df and "none" not in scope_df:
+        sources = identify_plots(modes)
+    else:
+        sources = [""]  # sets the source to blank as there are no differentiators
+    return(sources)
     
     
 def merge_dfs(model_df,scope_df,modes):
@@ -285,9 +849,13 @@ def merge_dfs(model_df,scope_df,modes):
     model_df_clean=crop_and_norm(model_df,modes,"m")
     
     
+    #resamples the model onto the times of the scope if requested
+    if modes['align'] in ['nearest','linear']:
+        model_df_clean=align_model(model_df_clean,scope_df_clean,modes)
+    
     #merges the two datagrames using time and frequency
-    merge_df=pd.merge(model_df_clean,scope_df_clean,on=('Time','Freq'),
-                      suffixes=('_model','_scope'))
+    merge_df=grid_merge(model_df_clean,scope_df_clean,modes,
+                        suffixes=('_model','_scope'))
     if len(merge_df) > 0:
         #calculates differences between model and scope values for each channel
         for channel in ["xx","xy","yy","U","V","I","Q"]:
@@ -303,6 +871,190 @@ def merge_dfs(model_df,scope_df,modes):
     return(merge_df)        
 
 
+def grid_merge(model_df,scope_df,modes,suffixes=('_model','_scope')):
+    '''
+    This function joins the model and scope dataframes on time and frequency 
+    using integer coordinates on the time/frequency grid of the model.
+    
+    Each scope time is matched to the nearest model time if they are within 
+    modes['time_tolerance'] seconds of one another, and each frequency must 
+    match exactly.  The rows are then aligned through a lookup table indexed 
+    by the grid coordinates, rather than with a general pandas merge.  If 
+    several scope rows fall on one grid point, sorted searches are used so 
+    that every pair of matching rows is kept.
+    
+    The result has the same layout as pd.merge(on=('Time','Freq')): rows are 
+    in the order of the model dataframe, Time is taken from the model, and 
+    columns present in both dataframes are given the suffixes.
+    '''
+    tolerance=int(round(modes['time_tolerance']*1e9))
+    
+    #converts the times to integer nanoseconds for the searches
+    model_times=model_df['Time'].values.astype('datetime64[ns]').view(np.int64)
+    scope_times=scope_df['Time'].values.astype('datetime64[ns]').view(np.int64)
+    model_freqs=model_df['Freq'].values
+    scope_freqs=scope_df['Freq'].values
+    
+    #the grid is defined by the unique times and frequencies of the model
+    #factorize hashes the values, so only the unique values are sorted
+    model_time_index,grid_times=pd.factorize(model_times,sort=True)
+    model_freq_index,grid_freqs=pd.factorize(model_freqs,sort=True)
+    n_freqs=len(grid_freqs)
+    grid_size=len(grid_times)*n_freqs
+    
+    #grid coordinates of the model rows
+    model_keys=model_time_index.astype(np.int64)*n_freqs+model_freq_index
+    
+    #grid coordinates of the scope rows, -1 where they are not on the grid
+    scope_keys=np.full(len(scope_df),-1,dtype=np.int64)
+    if grid_size>0 and len(scope_df)>0:
+        if tolerance>0:
+            time_index=match_times(scope_times,grid_times,tolerance)
+        else:
+            time_index=pd.Index(grid_times).get_indexer(scope_times)
+        freq_index=pd.Index(grid_freqs).get_indexer(scope_freqs)
+        on_grid=(time_index>=0)&(freq_index>=0)
+        scope_keys[on_grid]=time_index[on_grid]*n_freqs+freq_index[on_grid]
+    scope_rows=np.flatnonzero(scope_keys>=0)
+    
+    if np.bincount(scope_keys[scope_rows],minlength=1).max()<=1:
+        #at most one scope row per grid point, so uses a lookup table
+        lookup=np.full(grid_size,-1,dtype=np.int64)
+        lookup[scope_keys[scope_rows]]=scope_rows
+        scope_index=lookup[model_keys]
+        model_index=np.flatnonzero(scope_index>=0)
+        scope_index=scope_index[model_index]
+    else:
+        #finds the range of matching scope rows for each model row
+        scope_order=np.argsort(scope_keys,kind='mergesort')
+        sorted_keys=scope_keys[scope_order]
+        first=np.searchsorted(sorted_keys,model_keys,side='left')
+        last=np.searchsorted(sorted_keys,model_keys,side='right')
+        counts=last-first
+        
+        #expands the ranges into pairs of row indices
+        model_index=np.repeat(np.arange(len(model_df)),counts)
+        offsets=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+        scope_index=scope_order[np.repeat(first,counts)+offsets]
+    
+    #takes the matching rows and disambiguates the shared columns
+    left_df=model_df.take(model_index).reset_index(drop=True)
+    right_df=scope_df.drop(['Time','Freq'],axis=1)\
+                .take(scope_index).reset_index(drop=True)
+    shared=[col for col in right_df.columns if col in left_df.columns]
+    left_df=left_df.rename(columns=dict((col,col+suffixes[0]) for col in shared))
+    right_df=right_df.rename(columns=dict((col,col+suffixes[1]) for col in shared))
+    
+    return(pd.concat([left_df,right_df],axis=1))
+
+def match_times(in_times,grid_times,tolerance):
+    '''
+    For each of in_times, returns the index of the nearest of the sorted 
+    grid_times, or -1 if the nearest is further away than the tolerance.
+    All times are integers in the same units as the tolerance.
+    '''
+    n_grid=len(grid_times)
+    after=np.minimum(np.searchsorted(grid_times,in_times),n_grid-1)
+    before=np.maximum(after-1,0)
+    
+    #picks the closer of the neighbouring grid times, the earlier on a tie
+    dist_before=np.abs(in_times-grid_times[before])
+    dist_after=np.abs(grid_times[after]-in_times)
+    out_index=np.where(dist_after<dist_before,after,before)
+    out_index[np.minimum(dist_before,dist_after)>tolerance]=-1
+    
+    return(out_index)
+
+def align_model(model_df,scope_df,modes):
+    '''
+    This function resamples the model dataframe onto the times of the scope 
+    dataframe, separately for each frequency, so that the two can be merged 
+    on identical times.
+    
+    In 'nearest' mode, each scope time takes the values of the nearest model
+    time (within modes['time_tolerance'] seconds, if that is set).  In 
+    'linear' mode, the values are linearly interpolated between the model 
+    times on either side of the scope time.  Scope times outside the range of
+    the model are not interpolated and are dropped.
+    
+    The model times for each frequency are sorted once, and the scope times 
+    are located among them with binary searches.
+    '''
+    if modes['verbose'] >=2:
+        print("Aligning model to scope times using "+modes['align']+" mode")
+    
+    tolerance=int(round(modes['time_tolerance']*1e9))
+    if tolerance<=0:
+        tolerance=np.iinfo(np.int64).max
+        
+    #converts the times to integer nanoseconds for the searches
+    model_times=model_df['Time'].values.astype('datetime64[ns]').view(np.int64)
+    scope_times=scope_df['Time'].values.astype('datetime64[ns]').view(np.int64)
+    
+    #identifies the rows for each frequency
+    model_groups=model_df.groupby('Freq').indices
+    scope_groups=scope_df.groupby('Freq').indices
+    
+    before_list=[]
+    after_list=[]
+    weight_list=[]
+    time_list=[]
+    for freq in model_groups:
+        if freq not in scope_groups:
+            continue
+        #sorts the model rows for this frequency by time
+        freq_rows=model_groups[freq]
+        freq_rows=freq_rows[np.argsort(model_times[freq_rows],kind='mergesort')]
+        freq_times=model_times[freq_rows]
+        n_times=len(freq_times)
+        
+        target_times=np.unique(scope_times[scope_groups[freq]])
+        
+        if modes['align']=='nearest':
+            nearest=match_times(target_times,freq_times,tolerance)
+            found=nearest>=0
+            before=nearest[found]
+            after=before
+            weight=np.zeros(len(before))
+        else:
+            #finds the model times either side of each scope time
+            after=np.searchsorted(freq_times,target_times,side='right')
+            before=after-1
+            after=np.minimum(after,n_times-1)
+            found=(before>=0)&((freq_times[after]>=target_times)|
+                               (freq_times[np.maximum(before,0)]==target_times))
+            before=before[found]
+            after=after[found]
+            #calculates the fraction of the way from the earlier model time
+            gap=(freq_times[after]-freq_times[before]).astype(float)
+            weight=np.where(gap>0,
+                            (target_times[found]-freq_times[before])/np.maximum(gap,1),
+                            0.0)
+            
+        before_list.append(freq_rows[before])
+        after_list.append(freq_rows[after])
+        weight_list.append(weight)
+        time_list.append(target_times[found])
+    
+    if len(time_list)==0:
+        return(model_df.iloc[0:0].reset_index(drop=True))
+    
+    before_index=np.concatenate(before_list)
+    after_index=np.concatenate(after_list)
+    weights=np.concatenate(weight_list)
+    
+    #takes the earlier model row, then interpolates the numeric columns
+    out_df=model_df.take(before_index).reset_index(drop=True)
+    out_df['Time']=np.concatenate(time_list).view('datetime64[ns]')
+    if modes['align']=='linear':
+        for col in out_df.columns:
+            if col not in ['Time','Freq'] and out_df[col].values.dtype.kind in 'fc':
+                before_vals=model_df[col].values[before_index]
+                after_vals=model_df[col].values[after_index]
+                out_df[col]=before_vals+(after_vals-before_vals)*weights
+    
+    return(out_df)
+
 def crop_vals(in_df,modes):
     '''
     This function drops all rows where the value for the channel is greater 
@@ -310,6 +1062,10 @@ def crop_vals(in_df,modes):
     cropping argument
     
     This function also removes all 0.0 values for the various channels.
+    
+    When cropping by frequency or time, the limits for each unique frequency
+    or time are calculated together with a groupby, rather than cropping each
+    group separately.
     '''
     if modes['verbose'] >=2:
         print("Cropping values")
@@ -320,25 +1076,11 @@ def crop_vals(in_df,modes):
     elif 'f' in modes["crop_basis"]:
         if modes['verbose'] >=2:
             print("Crop basis: Frequency")
-        var_str='Freq'
-        unique_vals=in_df[var_str].unique()
-        out_df= pd.DataFrame(columns=in_df.columns)
-        for col in in_df:
-            out_df[col]=out_df[col].astype(in_df[col].dtypes.name)
-        for unique_val in unique_vals:
-            unique_df=in_df.loc[(in_df[var_str]==unique_val),:].copy()
-            out_df=out_df.append(crop_operation (unique_df,modes))
+        out_df=crop_operation (in_df,modes,'Freq')
     elif 't' in modes["crop_basis"]:
         if modes['verbose'] >=2:
             print("Crop basis: Time")
-        var_str='Time'
-        unique_vals=in_df[var_str].unique()
-        out_df= pd.DataFrame(columns=in_df.columns)
-        for col in in_df:
-            out_df[col]=out_df[col].astype(in_df[col].dtypes.name)
-        for unique_val in unique_vals:
-            unique_df=in_df.loc[(in_df[var_str]==unique_val),:].copy()
-            out_df=out_df.append(crop_operation (unique_df,modes))        
+        out_df=crop_operation (in_df,modes,'Time')
     else:
         out_df=crop_operation (in_df,modes)
         
@@ -346,53 +1088,113 @@ def crop_vals(in_df,modes):
     out_df.reset_index(drop=True, inplace=True) 
     return(out_df)
 
-def crop_operation (in_df,modes):
+def crop_operation (in_df,modes,var_str=None):
+    '''
+    This function drops the zero values of each dependent variable, and then 
+    the values above the limit set by the crop mode.  If var_str is given, 
+    the limits are calculated separately for each unique value of var_str.
+    
+    The columns are still cropped in turn, so the limit for each column is 
+    calculated from the rows kept by the previous columns, but the rows are 
+    tracked with a boolean mask and only dropped once at the end.  Complex 
+    columns are cropped by their magnitudes, as they are plotted.
+    '''
     if modes['verbose'] >=2:
         print("Carrying out Crop Operation")
-    out_df=in_df.copy()
+    
+    if var_str is None:
+        group_keys = None
+    else:
+        group_keys = in_df[var_str].values
+    
+    #marks the rows to keep
+    keep = np.ones(len(in_df), dtype=bool)
     #goes through all the columns of the data
-    for col in out_df:
+    for col in in_df:
         #targets the dependent variables
         if col not in ['Time', 'Freq', 'd_Time', 'original_Time']:
+            col_vals = np.asarray(plottable(in_df[col]))
             #drops all zero values from the data
-            out_df.drop(out_df[out_df[col] == 0.0].index, inplace=True)
+            keep &= (col_vals != 0.0)
             #if the cropping mode isn't set to 0, crop the scope data
             if 0.0 != modes['crop']:
-                if modes['crop_type'] == "median":
-                    col_limit = np.median(out_df[col])*modes['crop']
-                elif modes['crop_type'] == "mean":
-                    col_limit = np.mean(out_df[col])*modes['crop']
-                elif modes['crop_type'] == "percentile":
-                    if modes['crop'] < 100:
-                        col_limit = np.percentile(out_df[col], modes['crop'])
-                    else:
-                        if modes['verbose'] >=1:
-                            print("WARNING: Percentile must be less than 100")
-                        col_limit = np.max(plottable(out_df[col]))
+                if group_keys is None:
+                    col_limit = calc_crop_limit(col_vals[keep], None, modes)
                 else:
-                    if modes['verbose'] >=1:
-                        print("WARNING: crop_type incorrectly specified.")
-                    col_limit = np.median(out_df[col])*modes['crop']
-                out_df.drop(out_df[out_df[col] > col_limit].index, inplace=True)
+                    col_limit = calc_crop_limit(col_vals[keep], 
+                                                group_keys[keep], modes)
+                keep[keep] = ~(col_vals[keep] > col_limit)
                 # out_df.drop(out_df[out_df[col] < 0].index, inplace=True)
-            
+    
+    #drops all the cropped rows at once
+    out_df = in_df.loc[keep]
     return(out_df)
 
+def calc_crop_limit(col_vals, group_keys, modes):
+    '''
+    This function calculates the limit above which the values in the array 
+    col_vals are cropped, according to the crop type and level in modes.
+    
+    If group_keys is None, a single limit is returned for the whole array.  
+    Otherwise, a limit is calculated for each unique value of group_keys, and
+    an array giving the limit for each value is returned.
+    '''
+    if group_keys is None:
+        #treats the whole array as one group
+        grouped = pd.Series(col_vals).groupby(np.zeros(len(col_vals)))
+    else:
+        grouped = pd.Series(col_vals).groupby(group_keys)
+    
+    if modes['crop_type'] == "median":
+        group_limit = grouped.median()*modes['crop']
+    elif modes['crop_type'] == "mean":
+        group_limit = grouped.mean()*modes['crop']
+    elif modes['crop_type'] == "percentile":
+        if modes['crop'] < 100:
+            group_limit = grouped.quantile(modes['crop']/100.0)
+        else:
+            if modes['verbose'] >=1:
+                print("WARNING: Percentile must be less than 100")
+            group_limit = grouped.max()
+    else:
+        if modes['verbose'] >=1:
+            print("WARNING: crop_type incorrectly specified.")
+        group_limit = grouped.median()*modes['crop']
+    
+    if group_keys is None:
+        if len(group_limit) == 0:
+            return(np.nan)
+        return(group_limit.values[0])
     
-def calc_xy(in_df):
-    out_df = in_df.copy()
+    #broadcasts the limit for each group back to its values
+    return(group_limit.reindex(group_keys).values)
+    
+def calc_xy(in_df, inplace=False):
+    '''
+    this function calculates the linear polarisations xx, xy and yy from the
+    Jones matrix columns.  If inplace is set, the columns are added to in_df
+    rather than to a copy of it
+    '''
+    if inplace:
+        out_df = in_df
+    else:
+        out_df = in_df.copy()
     out_df['xx'] = np.real(out_df.J11*np.conj(out_df.J11)+out_df.J12*np.conj(out_df.J12))
     out_df['xy'] = out_df.J11*np.conj(out_df.J21)+out_df.J12*np.conj(out_df.J22)
     out_df['yy'] = np.real(out_df.J21*np.conj(out_df.J21)+out_df.J22*np.conj(out_df.J22))
     return(out_df)
 
 
-def calc_stokes(in_df,modes={'verbose':2},sources=[""]):
+def calc_stokes(in_df,modes={'verbose':2},sources=[""],inplace=False):
     '''
     this function calculates the Stokes UVIQ parameters for each time and 
-    frequency in a merged dataframe
+    frequency in a merged dataframe.  If inplace is set, the columns are added
+    to in_df rather than to a copy of it
     '''
-    out_df = in_df.copy()
+    if inplace:
+        out_df = in_df
+    else:
+        out_df = in_df.copy()
     if modes['verbose'] >=2:
         print("Calculating Stokes Parameters")
 
@@ -453,19 +1255,15 @@ def norm_operation(in_df, var_str,channel,modes,out_str=""):
 
     if modes['verbose'] >=2:
         print("Carrying out normalisation")
-    #identifies allthe unique values of the variable in the column
-    unique_vals=in_df[var_str].unique()
+    #finds the maximum (magnitude) of the channel for each unique value of 
+    #the variable, broadcast back to every row
+    group_max = pd.Series(np.asarray(plottable(in_df[channel])), 
+                          index=in_df.index).groupby(in_df[var_str]).transform('max').values
     
-
-    #iterates over all unique values
-    for unique_val in unique_vals:
-
-        unique_max = np.max(plottable(in_df.loc[(in_df[var_str]==unique_val),channel]))
-
-        if unique_max !=0:
-            in_df.loc[(in_df[var_str]==unique_val),(channel+out_str)]=in_df.loc[(in_df[var_str]==unique_val),channel]/unique_max
-        else:
-            in_df.loc[(in_df[var_str]==unique_val),(channel+out_str)]=0
+    #divides by the maximum, setting groups with a maximum of zero to zero
+    zero_max = (group_max == 0)
+    in_df[channel+out_str] = np.where(zero_max, 0, 
+         in_df[channel].values/np.where(zero_max, 1, group_max))
 
 def calc_diff(merge_df, modes, channel):
     '''
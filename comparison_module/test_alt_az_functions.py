@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the coordinate functions, checking the vectorised
+conversion to station coordinates against values stored from the original
+per-sample casacore conversion, so that casacore is not needed to run them.
+The stored values are printed by WIP/station_coords_reference.py.  If 
+casacore (and ilisa) are installed, the conversions are also compared 
+directly.
+
+usage: python -m pytest test_alt_az_functions.py
+
+@author: creanero
+"""
+import numpy as np
+import pytest
+
+from alt_az_functions import rotate_to_station
+from alt_az_functions import rotate_to_station_casacore
+from alt_az_functions import horizon_to_station
+from alt_az_functions import horizon_to_station_casacore
+
+# a station near IE613, in the form returned by 
+# antennafieldlib.getArrayBandParams: the ITRF position in metres as a column,
+# and the rotation matrix whose columns are the station axes, turned by 7.5 
+# degrees from local East and North
+STN_POS = np.array([[3801633.868], [-529022.268], [5076996.892]])
+STN_ROT = np.array([[ 0.24002641954578885, -0.7672368194255743 ,  0.5947562364849632 ],
+                    [ 0.9675970244314975 ,  0.2385499545908737 , -0.08276422823904085],
+                    [-0.07837930996979292,  0.595349966055614  ,  0.7996343549937298 ]])
+
+# horizontal azimuths and elevations in degrees
+AZ = np.array([283.678, 301.644,   9.946, 311.148, 178.335, 187.513, 329.941,
+               352.927, 196.843, 342.81 , 120.219, 134.232])
+EL = np.array([26.594, 73.494, 60.14 , 88.817, 52.014, 15.593, 16.416, 21.388,
+               11.818, 40.22 , 17.577, 55.732])
+
+# station azimuths and elevations in degrees for the directions above, from
+# the per-sample conversion of rotate_to_station_casacore with this station 
+# (python-casacore 3.8.1)
+AZ_CC = np.array([ -83.9120365592798   ,  -66.39032686708306  ,
+                     2.5019841420032387,  -63.82399592057183  ,
+                   170.8418423109428   , -179.99370163331895  ,
+                   -37.58643572783156  ,  -14.581963916944103 ,
+                  -170.66811908274457  ,  -24.73641316052785  ,
+                   112.76945247763935  ,  126.92564235724221  ])
+EL_CC = np.array([26.637577501890153, 73.59026365271201 , 60.322089790133845,
+                  88.92956412064204 , 51.82919372504749 , 15.409701759151394,
+                  16.5759968381678  , 21.571475280727682, 11.641041872893034,
+                  40.396603118491285, 17.483876270776978, 55.6028073936168  ])
+
+
+def assert_same_directions(az_1, el_1, az_2, el_2):
+    '''
+    checks that two sets of station directions agree to a milliarcsecond
+    '''
+    # azimuth differences are wrapped to +/-180 degrees
+    az_diff = (np.asarray(az_1)-az_2+180.0) % 360.0-180.0
+    assert np.max(np.abs(az_diff))*3600 < 1e-3
+    assert np.max(np.abs(np.asarray(el_1)-el_2))*3600 < 1e-3
+
+
+def test_rotate_to_station_matches_casacore():
+    '''
+    the vectorised conversion agrees with casacore to a milliarcsecond
+    '''
+    az_stn, el_stn = rotate_to_station(STN_POS, STN_ROT, AZ, EL)
+
+    assert_same_directions(AZ_CC, EL_CC, az_stn, el_stn)
+
+
+def test_rotate_to_station_matches_live_casacore():
+    '''
+    the vectorised conversion agrees with casacore run now, and so do the 
+    stored values
+    '''
+    pytest.importorskip("casacore.measures")
+    az_cc, el_cc = rotate_to_station_casacore(STN_POS, STN_ROT, AZ, EL)
+    az_stn, el_stn = rotate_to_station(STN_POS, STN_ROT, AZ, EL)
+
+    assert_same_directions(az_cc, el_cc, az_stn, el_stn)
+    assert_same_directions(az_cc, el_cc, AZ_CC, EL_CC)
+
+
+def test_horizon_to_station_matches_casacore():
+    '''
+    the vectorised conversion agrees with casacore for a real station
+    '''
+    pytest.importorskip("casacore.measures")
+    pytest.importorskip("ilisa.antennameta.antennafieldlib")
+    az_cc, el_cc = horizon_to_station_casacore("IE613", AZ, EL)
+    az_stn, el_stn = horizon_to_station("IE613", AZ, EL)
+
+    assert_same_directions(az_cc, el_cc, az_stn, el_stn)
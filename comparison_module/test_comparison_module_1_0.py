@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the command line arguments of the comparison module.
+
+usage: python -m pytest test_comparison_module_1_0.py
+
+@author: creanero
+"""
+import argparse
+
+import pandas as pd
+import pytest
+
+from comparison_module_1_0 import timestamp_arg
+
+
+@pytest.mark.parametrize("time_str", ["2018-03-16T11:40:00",
+                                      "2018-03-16T11:40:00Z",
+                                      "2018-03-16T11:40:00+00:00",
+                                      "2018-03-16T12:40:00+01:00"])
+def test_timestamp_arg_gives_naive_utc(time_str):
+    '''
+    timestamps with a time zone are converted to UTC without a time zone, so
+    that they can be compared with the times of the data
+    '''
+    time_stamp = timestamp_arg(time_str)
+
+    assert time_stamp.tzinfo is None
+    assert time_stamp == pd.Timestamp("2018-03-16 11:40:00")
+
+
+@pytest.mark.parametrize("time_str", ["", "NaT", "not a time"])
+def test_timestamp_arg_rejects_bad_times(time_str):
+    '''
+    values which are not times are rejected by the argument parser
+    '''
+    with pytest.raises(argparse.ArgumentTypeError):
+        timestamp_arg(time_str)
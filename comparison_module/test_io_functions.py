@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the input and output functions, checking that badly
+formed batch job files are rejected before any jobs are run.
+
+usage: python -m pytest test_io_functions.py
+
+@author: creanero
+"""
+import os
+
+import pytest
+
+from io_functions import read_job_file
+
+
+@pytest.mark.parametrize("file_name, text", [
+    ("jobs.json", '[{"crop": 2.0}'),
+    ("jobs.yaml", 'jobs: [crop: 2.0\n'),
+    ("jobs.json", '3'),
+    ("jobs.json", '[{"crop": 2.0}, 2]'),
+    ("jobs.json", '{"jobs": {"crop": 2.0}}'),
+    ("jobs.json", '{"jobs": [{"crop": 2.0}], "defaults": 3}')])
+def test_read_job_file_rejects_bad_files(tmpdir, file_name, text):
+    '''
+    job files which cannot be parsed, or are not lists of dictionaries of
+    options, exit with an error
+    '''
+    if file_name.endswith(".yaml"):
+        pytest.importorskip("yaml")
+    file_name = os.path.join(str(tmpdir), file_name)
+    with open(file_name, "w") as job_file:
+        job_file.write(text)
+
+    with pytest.raises(SystemExit):
+        read_job_file(file_name, {'verbose':0})
+
+
+def test_read_job_file_applies_defaults(tmpdir):
+    '''
+    the defaults are applied to every job, and the job options replace them
+    '''
+    file_name = os.path.join(str(tmpdir), "jobs.json")
+    with open(file_name, "w") as job_file:
+        job_file.write('{"defaults": {"crop": 2.0, "norm": "f"}, '+
+                       '"jobs": [{"title": "a"}, {"title": "b", "crop": 5.0}]}')
+
+    jobs = read_job_file(file_name, {'verbose':0})
+
+    assert jobs == [{"crop": 2.0, "norm": "f", "title": "a"},
+                    {"crop": 5.0, "norm": "f", "title": "b"}]
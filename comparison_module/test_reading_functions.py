@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the file reading functions, checking the bulk readers
+against the original readers on small synthetic files.
+
+usage: python -m pytest test_reading_functions.py
+
+@author: creanero
+"""
+import os
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from reading_functions import read_OSO_h5
+from reading_functions import read_acc_folder
+from reading_functions import crop_operation
+from reading_functions import read_jones_csv
+from reading_functions import read_jones_csv_converters
+from reading_functions import read_jones_out
+from reading_functions import read_jones_out_lines
+from reading_functions import read_all_sky_jones
+from reading_functions import JONES_COLS
+
+
+def make_dreambeam_csv(file_name, n_times=7, n_freqs=5):
+    '''
+    writes a DreamBeam csv file of random Jones matrices, including values
+    with exponents, negative zeros and negative imaginary parts
+    '''
+    rng = np.random.RandomState(613)
+    n_rows = n_times*n_freqs
+    times = pd.date_range("2018-03-01", periods=n_times, freq="519s")
+    out_df = pd.DataFrame(data={
+        "Time": np.repeat(times.strftime("%Y-%m-%dT%H:%M:%S"), n_freqs),
+        "Freq": np.tile(1e8+np.arange(n_freqs)*1e8/512, n_times)})
+    for col in JONES_COLS:
+        vals = (rng.randn(n_rows)*10.0**rng.randint(-12, 3, n_rows)+
+                1j*rng.randn(n_rows)*10.0**rng.randint(-12, 3, n_rows))
+        vals[0] = complex(-0.0, -0.0)
+        out_df[col] = [str(val) for val in vals]
+    out_df.to_csv(file_name, index=False,
+                  columns=["Time", "Freq"]+JONES_COLS)
+
+
+def test_read_jones_csv_matches_converters(tmpdir):
+    '''
+    the bulk reader gives exactly the values of the complex converters
+    '''
+    file_name = os.path.join(str(tmpdir), "model.csv")
+    make_dreambeam_csv(file_name)
+
+    bulk_df = read_jones_csv(file_name)
+    conv_df = read_jones_csv_converters(file_name)
+
+    assert list(bulk_df.columns) == list(conv_df.columns)
+    assert (bulk_df.Time.values == conv_df.Time.values).all()
+    assert (bulk_df.Freq.values == conv_df.Freq.values).all()
+    for col in JONES_COLS:
+        # compares the bits, so that signed zeros are also checked
+        assert (bulk_df[col].values.view(np.int64) ==
+                conv_df[col].values.view(np.int64)).all()
+
+
+def make_jones_out(file_name, n_points=9, pure_imag=False):
+    '''
+    writes a DreamBeam all-sky .out file of random pointings and Jones 
+    matrices, including values with exponents and signed zeros.  If pure_imag
+    is set, some elements are written without a real part, as str() does for
+    complex numbers whose real part is a positive zero
+    '''
+    rng = np.random.RandomState(613)
+    jones = (rng.randn(n_points, 4)*10.0**rng.randint(-12, 3, (n_points, 4))+
+             1j*rng.randn(n_points, 4)*10.0**rng.randint(-12, 3, (n_points, 4)))
+    jones[0] = [complex(-0.0, -0.0), complex(-0.0, 0.0), complex(1.0, -0.0),
+                complex(-2.5e-300, 0.0)]
+    if pure_imag:
+        jones[1] = [1j, complex(0.0, -0.0), complex(0.0, -2.5), 0j]
+    lines = []
+    for i in range(n_points):
+        lines.append("2018-10-15T00:00:00 150000000.0 %r %r" %
+                     (float(rng.uniform(0, 2*np.pi)),
+                      float(rng.uniform(0, np.pi/2))))
+        lines.append(str(i)+" "+" ".join([str(val) for val in jones[i]]))
+    with open(file_name, "w") as out_file:
+        out_file.write("\n".join(lines)+"\n")
+
+
+def assert_same_jones(bulk_df, lines_df):
+    '''
+    checks that two all-sky frames have exactly the same pointings and Jones
+    matrix elements
+    '''
+    assert (bulk_df.az.values == lines_df.az.values).all()
+    assert (bulk_df.alt.values == lines_df.alt.values).all()
+    for col in JONES_COLS:
+        # compares the bits, so that signed zeros are also checked
+        assert (bulk_df[col].values.view(np.int64) ==
+                lines_df[col].values.view(np.int64)).all()
+
+
+def test_read_jones_out_matches_lines(tmpdir):
+    '''
+    the bulk all-sky reader gives exactly the values of the line reader
+    '''
+    file_name = os.path.join(str(tmpdir), "all_sky.out")
+    make_jones_out(file_name)
+
+    bulk_df = read_jones_out(file_name)
+    lines_df = read_jones_out_lines(file_name)
+
+    assert list(bulk_df.columns) == list(lines_df.columns)
+    assert_same_jones(bulk_df, lines_df)
+
+
+def test_read_all_sky_jones_falls_back_to_lines(tmpdir):
+    '''
+    elements without a real part are not read in bulk, and are read exactly
+    by the line reader instead
+    '''
+    file_name = os.path.join(str(tmpdir), "all_sky.out")
+    make_jones_out(file_name, pure_imag=True)
+
+    with pytest.raises(ValueError):
+        read_jones_out(file_name)
+    all_sky_df = read_all_sky_jones(file_name, {'verbose':0})
+    lines_df = read_jones_out_lines(file_name)
+
+    assert_same_jones(all_sky_df, lines_df)
+
+
+def make_oso_h5(file_name, n_times=6, n_freqs=4):
+    '''
+    writes an OSO HDF5 file of random values, with uneven fractional times 
+    '''
+    rng = np.random.RandomState(613)
+    with h5py.File(file_name, 'w') as f:
+        f["timeaccstart"] = 1521199571.0+np.cumsum(rng.uniform(1, 600, n_times))
+        f["frequency"] = 1e8+np.arange(n_freqs)*1e8/512
+        f["XX"] = rng.uniform(0, 1e6, (n_times, n_freqs))
+        f["XY"] = (rng.randn(n_times, n_freqs)+
+                   1j*rng.randn(n_times, n_freqs))*1e5
+        f["YY"] = rng.uniform(0, 1e6, (n_times, n_freqs))
+
+
+def read_OSO_h5_loop(file_name):
+    '''
+    the original reader, which builds the frame one value at a time
+    '''
+    f = h5py.File(file_name, 'r')
+    time_list=[]
+    d_time=[]
+    freq_list=[]
+    xx_list=[]
+    xy_list=[]
+    yy_list=[]
+    time_index=0
+    f_start_list = list(f["timeaccstart"])
+    f_freq_list = list(f['frequency'])
+    f_xx=list(f['XX'])
+    f_xy=list(f['XY'])
+    f_yy=list(f['YY'])
+    min_time=pd.to_datetime(min(f_start_list),unit='s')
+    for time_val in f_start_list:
+        freq_index=0
+        for freq_val in f_freq_list:
+            time_stamp_val=pd.to_datetime(time_val,unit='s')
+            time_list.append(time_stamp_val)
+            d_time.append((time_stamp_val-min_time)/np.timedelta64(1,'s'))
+            freq_list.append(freq_val)
+            xx_list.append(f_xx[time_index][freq_index])
+            xy_list.append(f_xy[time_index][freq_index])
+            yy_list.append(f_yy[time_index][freq_index])
+            freq_index = freq_index+1
+        time_index=time_index+1
+    f.close()
+    out_df=pd.DataFrame(data={'Time':time_list, 'd_Time':d_time, 
+                                'Freq':freq_list,
+                                'xx':xx_list,'xy':xy_list,'yy':yy_list})
+    return(out_df)
+
+
+def test_read_OSO_h5_matches_loop(tmpdir):
+    '''
+    the vectorised reader gives the same frame as the original loop
+    '''
+    file_name = os.path.join(str(tmpdir), "scope.hdf5")
+    make_oso_h5(file_name)
+    modes = {'verbose':0, 'time_window':None, 'subband_window':None}
+
+    vec_df = read_OSO_h5(file_name, modes)
+    loop_df = read_OSO_h5_loop(file_name)
+
+    pd.testing.assert_frame_equal(vec_df, loop_df, check_exact=True)
+
+
+def make_merge_df(n_times=8, n_freqs=6):
+    '''
+    makes a frame of random xx, xy and yy values on a time and frequency grid,
+    with some zeros and some outliers to be cropped
+    '''
+    rng = np.random.RandomState(613)
+    n_rows = n_times*n_freqs
+    times = pd.date_range("2018-03-01", periods=n_times, freq="519s")
+    in_df = pd.DataFrame(data={'Time':np.repeat(times, n_freqs),
+                               'Freq':np.tile(1e8+np.arange(n_freqs)*1e8/512,
+                                              n_times)})
+    in_df['xx'] = rng.uniform(1, 2, n_rows)*10.0**rng.randint(0, 3, n_rows)
+    in_df['xy'] = (rng.randn(n_rows)+1j*rng.randn(n_rows))*10.0**rng.randint(0, 3, n_rows)
+    in_df['yy'] = rng.uniform(1, 2, n_rows)*10.0**rng.randint(0, 3, n_rows)
+    in_df.loc[rng.randint(0, n_rows, 4), 'xx'] = 0.0
+    in_df.loc[rng.randint(0, n_rows, 4), 'yy'] = 0.0
+    return(in_df)
+
+
+def crop_operation_loop(in_df, modes, var_str=None):
+    '''
+    the original crop, which crops each group separately and drops the rows 
+    for each column in turn.  Complex columns are cropped by their magnitudes,
+    as they are by crop_operation.  Returns the index of the rows kept
+    '''
+    if var_str is None:
+        group_dfs = [in_df]
+    else:
+        group_dfs = [in_df.loc[in_df[var_str]==unique_val]
+                     for unique_val in in_df[var_str].unique()]
+    kept = []
+    for out_df in group_dfs:
+        for col in out_df:
+            if col not in ['Time', 'Freq', 'd_Time', 'original_Time']:
+                out_df = out_df.drop(out_df[np.abs(out_df[col]) == 0.0].index)
+                col_vals = np.abs(out_df[col].values)
+                if modes['crop_type'] == "median":
+                    col_limit = np.median(col_vals)*modes['crop']
+                elif modes['crop_type'] == "mean":
+                    col_limit = np.mean(col_vals)*modes['crop']
+                else:
+                    col_limit = np.percentile(col_vals, modes['crop'])
+                out_df = out_df.drop(out_df[col_vals > col_limit].index)
+        kept.extend(out_df.index)
+    return(np.sort(kept))
+
+
+@pytest.mark.parametrize("crop_type, crop", [("median", 2.0), ("mean", 1.5),
+                                              ("percentile", 90.0)])
+@pytest.mark.parametrize("var_str", [None, 'Freq', 'Time'])
+def test_crop_operation_matches_loop(crop_type, crop, var_str):
+    '''
+    the single-mask crop keeps the same rows as cropping each group in turn
+    '''
+    in_df = make_merge_df()
+    modes = {'verbose':0, 'crop_type':crop_type, 'crop':crop}
+
+    out_df = crop_operation(in_df, modes, var_str)
+    kept = crop_operation_loop(in_df, modes, var_str)
+
+    assert len(kept) < len(in_df)
+    assert list(out_df.index) == list(kept)
+    pd.testing.assert_frame_equal(out_df, in_df.loc[kept], check_exact=True)
+
+
+def make_acc_folder(folder, start_times, subbands=4, rcus=4):
+    '''
+    writes a folder of ACC files of random covariances, one per start time
+    '''
+    rng = np.random.RandomState(613)
+    os.mkdir(folder)
+    for start_time in start_times:
+        file_name = (pd.Timestamp(start_time).strftime("%Y%m%d_%H%M%S")+
+                     "_acc_"+str(subbands)+"x"+str(rcus)+"x"+str(rcus)+".dat")
+        acc_cube = (rng.randn(subbands, rcus, rcus)+
+                    1j*rng.randn(subbands, rcus, rcus))
+        acc_cube.astype('<c16').tofile(os.path.join(folder, file_name))
+
+
+@pytest.mark.parametrize("subband_window", [None, [1, 2]])
+def test_read_acc_folder_subband_times(tmpdir, subband_window):
+    '''
+    each subband of an ACC file is given the time it was sampled at, one 
+    second after the subband before it, counted from the start of the file
+    '''
+    folder = os.path.join(str(tmpdir), "IE613_20180406_091321_rcu3_acc")
+    start_times = ["2018-04-06 09:13:21", "2018-04-06 09:20:00"]
+    make_acc_folder(folder, start_times)
+    modes = {'verbose':0, 'time_window':None, 'subband_window':subband_window,
+             'jobs':1}
+
+    out_df = read_acc_folder(folder, modes)
+
+    if subband_window is None:
+        subbands = np.arange(4)
+    else:
+        subbands = np.arange(subband_window[0], subband_window[1]+1)
+    expected = [pd.Timestamp(start_time)+pd.Timedelta(seconds=int(subband))
+                for start_time in start_times for subband in subbands]
+    assert list(out_df.Time) == expected
+    assert list(out_df.d_Time) == [(time-expected[0]).total_seconds()
+                                   for time in expected]
+
+
+def test_read_acc_folder_time_window(tmpdir):
+    '''
+    only the subbands sampled inside the time window are kept
+    '''
+    folder = os.path.join(str(tmpdir), "IE613_20180406_091321_rcu3_acc")
+    make_acc_folder(folder, ["2018-04-06 09:13:21", "2018-04-06 09:20:00"])
+    modes = {'verbose':0, 'subband_window':None, 'jobs':1,
+             'time_window':[pd.Timestamp("2018-04-06 09:13:23"),
+                            pd.Timestamp("2018-04-06 09:20:01")]}
+
+    out_df = read_acc_folder(folder, modes)
+
+    assert list(out_df.Time) == [pd.Timestamp("2018-04-06 09:13:23"),
+                                 pd.Timestamp("2018-04-06 09:13:24"),
+                                 pd.Timestamp("2018-04-06 09:20:00"),
+                                 pd.Timestamp("2018-04-06 09:20:01")]
+    assert list(out_df.d_Time) == [0.0, 1.0, 397.0, 398.0]
@@ -153,4 +153,21 @@ def get_alt_az_var(merge_df, modes):
         'stn_az' in merge_df):
         az_var = "stn_"+az_var
         alt_var = "stn_"+alt_var
-    return(alt_var, az_var, az_var_ew)
\ No newline at end of file
+    return(alt_var, az_var, az_var_ew)
+
+def identify_plots(modes):
+    sources = []
+
+
+    if "model" in modes["plots"]:
+        sources.append("model")
+    if "scope" in modes["plots"]:
+        sources.append("scope")
+    if "diff" in modes["plots"]:
+        sources.append("diff")
+
+    if len(sources) == 0:
+        if modes['verbose'] >=1:
+            print ("Warning: Sources not specified, no values will be plotted")
+
+    return (sources)